@@ -0,0 +1,232 @@
+"""
+Agreement analytics over many saved runs at once. All result matrices are stacked into one
+runs x questions x parties array (NaN = no answer), and every statistic is computed on the
+whole stack with array operations, so hundreds of runs compare in milliseconds:
+
+    python src/analytics.py --data Party_Answers_Converted_de.json --output analytics.json
+    python src/analytics.py --model gpt-4o --rag-mode retrieval_only
+
+Runs come from the run store (only those on the same party file); --csv reads the old
+results_*.csv files instead.
+"""
+import argparse
+import glob
+import json
+import re
+
+import numpy as np
+
+from data_processing import load_and_process_data
+from run_store import RunStore
+from storage import file_sha256
+
+RESULT_PATTERNS = ("results_rag_*.csv", "results_GPT_*.csv")
+# Answer values, in confusion matrix order
+VALUES = (-1, 0, 1)
+
+
+def _run_sort_key(path):
+    match = re.search(r"_(\d+)\.csv$", path)
+    return (re.sub(r"_\d+\.csv$", "", path), int(match.group(1)) if match else 0)
+
+
+def stack_matrices(matrices, shape=None):
+    """Stack 2-D answer matrices into runs x questions x parties, NaN-padding or cropping them to shape."""
+    shape = shape or tuple(np.max([m.shape for m in matrices], axis=0))
+    stack = np.full((len(matrices),) + tuple(shape), np.nan)
+    for idx, matrix in enumerate(matrices):
+        rows, cols = min(matrix.shape[0], shape[0]), min(matrix.shape[1], shape[1])
+        stack[idx, :rows, :cols] = matrix[:rows, :cols]
+    return stack
+
+
+def load_result_matrices(patterns=RESULT_PATTERNS, shape=None):
+    """(run names, stacked matrices) of every result CSV matching patterns."""
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)}, key=_run_sort_key)
+    matrices = [np.loadtxt(path, delimiter=",", ndmin=2) for path in paths]
+    if not matrices:
+        return [], np.empty((0,) + tuple(shape or (0, 0)))
+    return paths, stack_matrices(matrices, shape)
+
+
+def load_stored_runs(store=None, shape=None, **filters):
+    """(run names, stacked matrices) of the stored runs matching filters, read in one query."""
+    store = store or RunStore()
+    run_ids, matrices = store.load_matrices(**filters)
+    runs = {run["run_id"]: run for run in store.list_runs(**filters)}
+    if not matrices:
+        return [], np.empty((0,) + tuple(shape or (0, 0)))
+    names = [f"run {run_id} ({runs[run_id]['model']}, {runs[run_id]['rag_mode'] or 'no rag'})" for run_id in run_ids]
+    return names, stack_matrices(matrices, shape)
+
+
+def agreement(stack, reference):
+    """
+    Share of answered cells matching the reference, per run, per run and party and per run
+    and question. Unanswered cells (NaN in either) are left out; empty groups are NaN.
+    """
+    answered = ~np.isnan(stack) & ~np.isnan(reference)
+    matches = (stack == reference) & answered
+
+    def ratio(axis):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return matches.sum(axis=axis) / answered.sum(axis=axis)
+
+    return {
+        "per_run": ratio((1, 2)),
+        "per_party": ratio(1),
+        "per_question": ratio(2),
+        "answered": answered.sum(axis=(1, 2)),
+    }
+
+
+def weighted_distance(stack, reference):
+    """Mean |answer - reference| over answered cells (0 = identical, 2 = always opposite), per run."""
+    diff = np.abs(stack - reference).reshape(len(stack), -1)
+    answered = ~np.isnan(diff)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(answered, diff, 0).sum(axis=1) / answered.sum(axis=1)
+
+
+def confusion_matrices(stack, reference):
+    """runs x 3 x 3 counts; rows are the reference answer, columns the run's, in VALUES order."""
+    runs = len(stack)
+    reference = np.broadcast_to(reference, stack.shape)
+    answered = ~np.isnan(stack) & ~np.isnan(reference)
+    run_idx = np.broadcast_to(np.arange(runs)[:, None, None], stack.shape)[answered]
+    ref_idx = reference[answered].astype(np.int64) + 1
+    run_values = stack[answered].astype(np.int64) + 1
+    counts = np.bincount(run_idx * 9 + ref_idx * 3 + run_values, minlength=runs * 9)
+    return counts.reshape(runs, 3, 3)
+
+
+def cohens_kappa(confusion, weights=None):
+    """
+    Cohen's kappa of every confusion matrix in a runs x k x k stack. weights="linear" gives
+    the weighted kappa, where neutral vs. agree counts as half a disagreement.
+    """
+    confusion = confusion.astype(float)
+    k = confusion.shape[-1]
+    if weights == "linear":
+        grid = np.arange(k)
+        w = np.abs(grid[:, None] - grid[None, :]) / (k - 1)
+    else:
+        w = 1.0 - np.eye(k)
+    total = confusion.sum(axis=(1, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        observed = (confusion * w).sum(axis=(1, 2)) / total
+        expected_counts = confusion.sum(axis=2)[:, :, None] * confusion.sum(axis=1)[:, None, :] / total[:, None, None]
+        expected = (expected_counts * w).sum(axis=(1, 2)) / total
+        return 1.0 - observed / expected
+
+
+def bootstrap_agreement_ci(stack, reference, n_boot=1000, alpha=0.05, seed=0):
+    """
+    Percentile confidence interval of every run's agreement, resampling questions with
+    replacement (a question's cells stay together). Returns (low, high) arrays per run.
+    """
+    runs, num_questions = stack.shape[:2]
+    if runs == 0 or num_questions == 0:
+        return np.array([]), np.array([])
+    answered = ~np.isnan(stack) & ~np.isnan(reference)
+    matches_per_question = ((stack == reference) & answered).sum(axis=2)
+    answered_per_question = answered.sum(axis=2)
+
+    # How often each question is drawn in each resample, so all resamples are one matrix product
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, num_questions, size=(n_boot, num_questions))
+    counts = np.zeros((n_boot, num_questions))
+    np.add.at(counts, (np.arange(n_boot)[:, None], draws), 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        boot = (matches_per_question @ counts.T) / (answered_per_question @ counts.T)
+    low = np.nanpercentile(boot, 100 * alpha / 2, axis=1)
+    high = np.nanpercentile(boot, 100 * (1 - alpha / 2), axis=1)
+    return low, high
+
+
+def pairwise_agreement(stack):
+    """runs x runs share of cells answered by both runs on which they agree."""
+    flat = stack.reshape(len(stack), -1)
+    answered = (~np.isnan(flat)).astype(float)
+    matches = sum(((flat == value).astype(float) @ (flat == value).astype(float).T) for value in VALUES)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return matches / (answered @ answered.T)
+
+
+def summarize(names, stack, reference, party_names=None, n_boot=1000, seed=0):
+    """JSON-ready report of every statistic above."""
+    stats = agreement(stack, reference)
+    confusion = confusion_matrices(stack, reference)
+    kappa = cohens_kappa(confusion)
+    weighted_kappa = cohens_kappa(confusion, weights="linear")
+    distance = weighted_distance(stack, reference)
+    low, high = bootstrap_agreement_ci(stack, reference, n_boot=n_boot, seed=seed)
+
+    def clean(values):
+        return [None if np.isnan(value) else float(value) for value in np.atleast_1d(values)]
+
+    runs = []
+    for idx, name in enumerate(names):
+        run = {
+            "run": name,
+            "answered": int(stats["answered"][idx]),
+            "agreement": clean(stats["per_run"][idx])[0],
+            "agreement_ci": [clean(low[idx])[0], clean(high[idx])[0]],
+            "cohens_kappa": clean(kappa[idx])[0],
+            "weighted_kappa": clean(weighted_kappa[idx])[0],
+            "weighted_distance": clean(distance[idx])[0],
+            "confusion": confusion[idx].tolist(),
+            "per_question": clean(stats["per_question"][idx]),
+            "per_party": clean(stats["per_party"][idx]),
+        }
+        if party_names is not None:
+            run["per_party"] = dict(zip(party_names, run["per_party"]))
+        runs.append(run)
+    return {"values": list(VALUES), "runs": runs, "pairwise_agreement": pairwise_agreement(stack).tolist()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agreement statistics of all saved runs against the parties' answers")
+    parser.add_argument("--data", default="Party_Answers_Converted_de.json")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Bootstrap resamples for the confidence intervals")
+    parser.add_argument("--output", default="analytics.json")
+    parser.add_argument("--csv", action="store_true", help="Read results_*.csv files instead of the run store")
+    parser.add_argument("--model")
+    parser.add_argument("--rag", dest="is_rag", action="store_true", default=None)
+    parser.add_argument("--no-rag", dest="is_rag", action="store_false")
+    parser.add_argument("--rag-mode")
+    args = parser.parse_args()
+
+    reference, _, party_names = load_and_process_data(args.data)
+    if args.csv:
+        names, stack = load_result_matrices(shape=reference.shape)
+    else:
+        names, stack = load_stored_runs(
+            shape=reference.shape, model=args.model, is_rag=args.is_rag, rag_mode=args.rag_mode,
+            data_hash=file_sha256(args.data),
+        )
+    if not names:
+        print("No runs found")
+        return
+
+    report = summarize(names, stack, reference, party_names, n_boot=args.bootstrap)
+
+    def fmt(value):
+        return "n/a" if value is None else f"{value:.3f}"
+
+    for run in report["runs"]:
+        low, high = run["agreement_ci"]
+        print(
+            f"{run['run']:>24}: agreement {fmt(run['agreement'])} [{fmt(low)}, {fmt(high)}], "
+            f"kappa {fmt(run['cohens_kappa'])}, weighted kappa {fmt(run['weighted_kappa'])}, "
+            f"distance {fmt(run['weighted_distance'])} ({run['answered']} answered)"
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+
+from config import api_key, openai_base_url, async_max_concurrency, requests_per_minute, tokens_per_minute
+from llm_cache import async_cached_chat_completion
+
+
+class TokenBucket:
+    """Refills rate_per_minute units per minute, bursting up to one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        # Waiters queue on the lock, so the bucket is handed out first come first served
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+    def adjust(self, amount):
+        """Charge (or refund, if negative) units once the real cost of a request is known."""
+        self._refill()
+        self.available = min(self.capacity, self.available - amount)
+
+
+class RateLimiter:
+    """Request and token budgets per minute, plus a shared pause when the API answers 429."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.resume_at = 0.0
+
+    def pause(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    async def acquire(self, estimated_tokens):
+        while (delay := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(estimated_tokens)
+
+    def record_usage(self, estimated_tokens, used_tokens):
+        if self.tokens is not None:
+            self.tokens.adjust(used_tokens - estimated_tokens)
+
+
+def estimate_tokens(request):
+    # Roughly four characters per token, plus the completion budget
+    prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+    return prompt_chars // 4 + (request.get("max_tokens") or 0)
+
+
+def retry_after_seconds(error, attempt):
+    """Delay requested by a 429 response, falling back to exponential backoff."""
+    headers = error.response.headers if error.response is not None else {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(60.0, 2 ** attempt)
+
+
+async def create_with_retries(client, limiter, request, max_retries=6):
+    estimated = estimate_tokens(request)
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(estimated)
+        try:
+            response = await client.chat.completions.create(**request)
+        except openai.RateLimitError as e:
+            if attempt == max_retries:
+                raise
+            limiter.pause(retry_after_seconds(e, attempt))
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError):
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(min(60.0, 2 ** attempt))
+            continue
+        if response.usage is not None:
+            limiter.record_usage(estimated, response.usage.total_tokens)
+        return response
+
+
+async def run_chat_requests(jobs, on_result,
+                            max_concurrency=async_max_concurrency,
+                            requests_per_minute=requests_per_minute,
+                            tokens_per_minute=tokens_per_minute,
+                            client=None,
+                            limiter=None):
+    """
+    Send chat completions concurrently. jobs is a list of (job_id, prepare) where prepare()
+    returns the request arguments; it runs in a worker thread since retrieval is blocking.
+    on_result(job_id, request, response, error, latency) is called on the event loop as each
+    job finishes; latency covers the completion call, including rate-limit waits.
+    Pass a limiter to keep rate budgets and 429 pauses across several calls on one event loop.
+    """
+    owns_client = client is None
+    if owns_client:
+        # Retries are handled here so that 429s also pause the other in-flight requests
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=openai_base_url, max_retries=0)
+    if limiter is None:
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def create(**request):
+        return await create_with_retries(client, limiter, request)
+
+    async def run_job(job_id, prepare):
+        async with semaphore:
+            request = None
+            start = time.perf_counter()
+            try:
+                request = await asyncio.to_thread(prepare)
+                start = time.perf_counter()
+                response = await async_cached_chat_completion(create, **request)
+            except Exception as e:
+                on_result(job_id, request, None, e, time.perf_counter() - start)
+            else:
+                on_result(job_id, request, response, None, time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(run_job(job_id, prepare) for job_id, prepare in jobs))
+    finally:
+        if owns_client:
+            await client.close()
@@ -0,0 +1,82 @@
+"""
+Throughput of the voter matching engine on one core:
+
+    python src/benchmark_matching.py --voters 1000000 --parties 30 --questions 38
+    python src/benchmark_matching.py --data Party_Answers_Converted_de.json
+
+Voters are random answer vectors with some skipped and some double-weighted questions.
+"""
+import os
+
+# One core: BLAS must be limited before numpy is imported
+for variable in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(variable, "1")
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from matching import PartyMatcher, SKIP
+
+
+def random_voters(rng, num_voters, num_questions, skip_rate=0.1, weight_rate=0.2):
+    voters = rng.integers(-1, 2, size=(num_voters, num_questions), dtype=np.int8)
+    voters[rng.random((num_voters, num_questions)) < skip_rate] = SKIP
+    weights = np.where(rng.random((num_voters, num_questions)) < weight_rate, 2.0, 1.0).astype(np.float32)
+    return voters, weights
+
+
+def best_of(repeats, fn):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark voter matching throughput")
+    parser.add_argument("--data", default=None, help="Party answer file (default: random party answers)")
+    parser.add_argument("--voters", type=int, default=1_000_000)
+    parser.add_argument("--parties", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=38)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_matching.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.data:
+        matcher = PartyMatcher.from_party_file(args.data)
+    else:
+        party_matrix = rng.integers(-1, 2, size=(args.questions, args.parties)).astype(float)
+        matcher = PartyMatcher(party_matrix, [f"Party {idx + 1}" for idx in range(args.parties)])
+    voters, weights = random_voters(rng, args.voters, matcher.num_questions)
+
+    score_s = best_of(args.repeats, lambda: matcher.scores(voters, weights))
+    rank_s = best_of(args.repeats, lambda: matcher.rank(voters, weights))
+    top3_s = best_of(args.repeats, lambda: matcher.rank(voters, weights, top=3))
+
+    report = {
+        "voters": args.voters,
+        "parties": matcher.num_parties,
+        "questions": matcher.num_questions,
+        "score_voters_per_second": args.voters / score_s,
+        "rank_voters_per_second": args.voters / rank_s,
+        "top3_voters_per_second": args.voters / top3_s,
+    }
+    print(
+        f"{args.voters} voters x {matcher.num_parties} parties x {matcher.num_questions} questions: "
+        f"scores {report['score_voters_per_second'] / 1e6:.2f}M voters/s, "
+        f"full ranking {report['rank_voters_per_second'] / 1e6:.2f}M voters/s, "
+        f"top 3 {report['top3_voters_per_second'] / 1e6:.2f}M voters/s"
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
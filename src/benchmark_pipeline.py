@@ -0,0 +1,281 @@
+"""
+End-to-end benchmark of the index build and execute_calc2 against the local mock server,
+on a synthetic party file and PDF corpus of configurable size. Everything runs in a
+scratch directory, so the real index, caches and results are never touched.
+
+    python src/benchmark_pipeline.py --parties 50 --questions 200 --pdfs 20 --latency 0.05 --output bench.json
+    python src/benchmark_pipeline.py --parties 50 --questions 200 --baseline bench.json
+
+Reports index build and load time, cells/s, p50/p95 chat completion latency per cell and
+peak RSS (this process and its children) as JSON; --baseline prints the change per metric.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from mock_openai_server import MockServerThread
+
+# Ten known parties first, so the keyword classifier tags their manifestos without the LLM;
+# SPD leads since load_and_process_data orders the questions by SPD's answers
+SYNTHETIC_PARTIES = [
+    ("SPD", "Sozialdemokratische Partei Deutschlands"),
+    ("CDU/CSU", "Christlich Demokratische Union / Christlich Soziale Union"),
+    ("GRÜNE", "BÜNDNIS 90/DIE GRÜNEN"),
+    ("FDP", "Freie Demokratische Partei"),
+    ("AfD", "Alternative für Deutschland"),
+    ("DIE LINKE", "DIE LINKE"),
+    ("BSW", "Bündnis Sahra Wagenknecht"),
+    ("FREIE WÄHLER", "FREIE WÄHLER"),
+    ("Volt", "Volt Deutschland"),
+    ("ÖDP", "Ökologisch-Demokratische Partei"),
+]
+FILE_STEMS = ["spd", "cdu", "gruene", "fdp", "afd", "die_linke", "bsw", "freie_waehler", "volt", "oedp"]
+
+TOPICS = [
+    "der Mindestlohn", "die Schuldenbremse", "das Tempolimit", "die Wehrpflicht", "die Vermögensteuer",
+    "der Kohleausstieg", "das Bürgergeld", "die Rente mit 63", "die Mietpreisbremse", "die Kernkraft",
+]
+ACTIONS = ["erhöht werden", "abgeschafft werden", "eingeführt werden", "reformiert werden", "beibehalten werden"]
+WORDS = [
+    "Wir", "wollen", "fordern", "Deutschland", "Europa", "Zukunft", "Arbeit", "Klima", "Bildung", "Familien",
+    "sozial", "gerecht", "Wirtschaft", "Sicherheit", "Freiheit", "Investitionen", "Kommunen", "Digitalisierung",
+    "Energie", "Gesundheit", "Pflege", "Verkehr", "Steuern", "Rente", "stärken", "fördern", "sichern",
+]
+
+
+def party_name(idx):
+    if idx < len(SYNTHETIC_PARTIES):
+        return SYNTHETIC_PARTIES[idx]
+    return f"Partei {idx + 1}", f"Synthetische Partei {idx + 1}"
+
+
+def make_synthetic_dataset(path, num_parties, num_questions, seed=0):
+    """Party answer file in the format of Party_Answers_Converted_de.json."""
+    rng = random.Random(seed)
+    questions = []
+    for q in range(num_questions):
+        topic = TOPICS[q % len(TOPICS)]
+        action = ACTIONS[q // len(TOPICS) % len(ACTIONS)]
+        questions.append(f"{topic[0].upper()}{topic[1:]} soll {action} ({q + 1}).")
+    names = [party_name(p) for p in range(num_parties)]
+    party_answers = [
+        {
+            "Party_Name": short,
+            "Party_Full_Name": full,
+            "Question_Number": q + 1,
+            "Question_Label": question,
+            "Party_Answer": rng.choice([-1, 0, 1]),
+        }
+        for short, full in names
+        for q, question in enumerate(questions)
+    ]
+    data = {
+        "party_names": [short for short, _ in names],
+        "party_full_names": [full for _, full in names],
+        "party_answers": party_answers,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return path
+
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages):
+    """Minimal PDF with one Helvetica text stream per page; pages is a list of lists of lines."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    page_ids = []
+    for lines in pages:
+        text = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 800 Td {text} ET".encode("cp1252", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_synthetic_corpus(folder, num_pdfs, pages_per_pdf=5, lines_per_page=60, seed=0):
+    """Manifesto-like PDFs cycling over the known parties, named so the keyword classifier recognises them."""
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for doc in range(num_pdfs):
+        party = doc % len(SYNTHETIC_PARTIES)
+        short, full = SYNTHETIC_PARTIES[party]
+        pages = []
+        for page in range(pages_per_pdf):
+            lines = [f"Wahlprogramm {full} ({short})"] if page == 0 else []
+            while len(lines) < lines_per_page:
+                topic = rng.choice(TOPICS)
+                lines.append(f"{short}: {topic} - " + " ".join(rng.choice(WORDS) for _ in range(10)) + ".")
+            pages.append(lines)
+        write_text_pdf(os.path.join(folder, f"{FILE_STEMS[party]}_wahlprogramm_{doc + 1}.pdf"), pages)
+
+
+def override_settings(modules, **values):
+    """Set config values for this run, also in the modules that imported them by name."""
+    for module in modules:
+        for name, value in values.items():
+            if hasattr(module, name):
+                setattr(module, name, value)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux; children covers pool workers and ingestion processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {"self": own, "children": children}
+
+
+def completion_latencies(log_path):
+    latencies = []
+    if os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("event") == "completion" and record.get("latency_s") is not None:
+                    latencies.append(record["latency_s"])
+    return np.array(latencies)
+
+
+def compare_to_baseline(report, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nChange against {baseline_path}:")
+    for section in ("index", "run"):
+        for metric, value in report.get(section, {}).items():
+            old = baseline.get(section, {}).get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {section}.{metric}: {old:.4g} -> {value:.4g} ({(value - old) / old:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the index build and execute_calc2 against a mock OpenAI server")
+    parser.add_argument("--parties", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--pdfs", type=int, default=20, help="Synthetic PDFs to index (0 = no index, implies --no-rag)")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per synthetic PDF")
+    parser.add_argument("--mode", choices=["async", "sequential", "pool"], default="async")
+    parser.add_argument("--no-rag", action="store_true")
+    parser.add_argument("--rag-mode", choices=["tree_summarize", "retrieval_only"], default=None)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock server latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests answered with a 500")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every n-th mock request with a 429")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temporary directory)")
+    parser.add_argument("--output", default="benchmark_pipeline.json")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    server = MockServerThread(
+        latency=args.latency, rate_limit_every=args.rate_limit_every, error_rate=args.error_rate,
+        embedding_dim=args.embedding_dim, seed=args.seed,
+    ).start()
+    # Our client reads OPENAI_BASE_URL, llama_index reads OPENAI_API_BASE; both are read on import
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_BASE"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    import config
+    import data_processing
+    import llm_cache
+    import gpt_interface
+    import create_index
+    from interaction_log import stop_log
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="electomate-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    print(f"Benchmarking in {workdir} against {server.base_url}")
+
+    is_rag = not args.no_rag and args.pdfs > 0
+    modules = (config, data_processing, llm_cache, gpt_interface, create_index)
+    override_settings(
+        modules,
+        cutoff_parties=0,
+        cutoff_questions=0,
+        is_rag_context=is_rag,
+        use_async=args.mode == "async",
+        disable_parallelization=args.mode == "sequential",
+    )
+    if args.rag_mode:
+        override_settings(modules, rag_mode=args.rag_mode)
+
+    report = {"settings": vars(args), "index": {}, "run": {}}
+
+    if args.pdfs > 0:
+        make_synthetic_corpus(create_index.PDF_DIR, args.pdfs, args.pages, seed=args.seed)
+        start = time.perf_counter()
+        create_index.main()
+        report["index"]["build_s"] = time.perf_counter() - start
+        report["index"]["pdfs"] = args.pdfs
+
+        gpt_interface._index = None
+        start = time.perf_counter()
+        gpt_interface.get_index()
+        report["index"]["load_s"] = time.perf_counter() - start
+
+    data_path = make_synthetic_dataset("bench_parties.json", args.parties, args.questions, seed=args.seed)
+    cells = args.parties * args.questions
+    start = time.perf_counter()
+    gpt_interface.execute_calc2(data_path)
+    elapsed = time.perf_counter() - start
+
+    stop_log()  # Flush the interaction log so every completion latency can be read back
+    latencies = completion_latencies(config.interaction_log_path)
+    report["run"] = {
+        "cells": cells,
+        "seconds": elapsed,
+        "cells_per_second": cells / elapsed if elapsed else 0.0,
+        "latency_p50_s": float(np.percentile(latencies, 50)) if latencies.size else None,
+        "latency_p95_s": float(np.percentile(latencies, 95)) if latencies.size else None,
+    }
+    rss = peak_rss_mb()
+    report["run"]["peak_rss_mb"] = rss["self"]
+    report["run"]["peak_rss_children_mb"] = rss["children"]
+    report["mock_server"] = server.stats
+    server.stop()
+
+    print(
+        f"\n{cells} cells in {elapsed:.1f}s ({report['run']['cells_per_second']:.1f} cells/s), "
+        f"p50 {report['run']['latency_p50_s']}, p95 {report['run']['latency_p95_s']}, peak RSS {rss['self']:.0f} MB"
+    )
+    if report["index"]:
+        print(f"Index: built in {report['index']['build_s']:.1f}s, loaded in {report['index']['load_s']:.3f}s")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{output}'")
+    if baseline:
+        compare_to_baseline(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compares the two RAG modes on the same (party, question) cells: per-cell latency, token
+spend and agreement with the parties' own answers. Both modes see identical sources, and
+chat calls bypass the response cache so the latencies are real.
+
+    python src/benchmark_rag_modes.py --questions 10 --output benchmark_rag_modes.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+
+from config import get_openai_client
+from data_processing import load_dataset, load_and_process_data, convert_answer_to_number
+from gpt_interface import get_index, init_worker, build_request, parse_response_content, validate_answer
+from retrieval import prefetch_sources
+
+RAG_MODES = ("tree_summarize", "retrieval_only")
+
+
+def run_mode(filepath, cells, index, rag_mode, token_counter):
+    dataset = load_dataset(filepath)
+    answers = np.full((dataset.num_questions, dataset.num_parties), np.nan)
+    latencies = []
+    chat_prompt_tokens = 0
+    chat_completion_tokens = 0
+    token_counter.reset_counts()
+
+    for i, j in cells:
+        start = time.perf_counter()
+        request = build_request(filepath, i, j, True, index, rag_mode)
+        response = get_openai_client().chat.completions.create(**request)
+        latencies.append(time.perf_counter() - start)
+
+        if response.usage is not None:
+            chat_prompt_tokens += response.usage.prompt_tokens
+            chat_completion_tokens += response.usage.completion_tokens
+        parsed = validate_answer(parse_response_content(response.choices[0].message.content))
+        if parsed is not None:
+            answers[j][i] = convert_answer_to_number(parsed["AI_answer"])
+
+    latencies = np.array(latencies)
+    return answers, {
+        "cells": len(cells),
+        "latency_mean_s": float(latencies.mean()),
+        "latency_p50_s": float(np.percentile(latencies, 50)),
+        "latency_p95_s": float(np.percentile(latencies, 95)),
+        # Tokens spent by llama_index on the tree_summarize synthesis
+        "synthesis_tokens": token_counter.total_llm_token_count,
+        "chat_prompt_tokens": chat_prompt_tokens,
+        "chat_completion_tokens": chat_completion_tokens,
+        "total_tokens": token_counter.total_llm_token_count + chat_prompt_tokens + chat_completion_tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tree_summarize against retrieval-only RAG")
+    parser.add_argument("--data", default="Party_Answers_Converted_de.json")
+    parser.add_argument("--parties", type=int, default=0, help="Limit the number of parties (0 = configured cutoff)")
+    parser.add_argument("--questions", type=int, default=0, help="Limit the number of questions (0 = configured cutoff)")
+    parser.add_argument("--output", default="benchmark_rag_modes.json")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.data)
+    num_parties = min(args.parties or dataset.num_parties, dataset.num_parties)
+    num_questions = min(args.questions or dataset.num_questions, dataset.num_questions)
+    cells = [(i, j) for i in range(num_parties) for j in range(num_questions)]
+
+    original_matrix, _, _ = load_and_process_data(args.data)
+
+    token_counter = TokenCountingHandler()
+    Settings.callback_manager = CallbackManager([token_counter])
+
+    # Retrieve once so both modes answer from exactly the same sources
+    index = get_index()
+    init_worker(args.data, True, prefetch_sources(index, dataset))
+
+    report = {"cells": len(cells), "modes": {}}
+    answers = {}
+    for rag_mode in RAG_MODES:
+        print(f"Running {rag_mode} on {len(cells)} cells...")
+        answers[rag_mode], stats = run_mode(args.data, cells, index, rag_mode, token_counter)
+        report["modes"][rag_mode] = stats
+
+    for rag_mode, matrix in answers.items():
+        answered = ~np.isnan(matrix[:num_questions, :num_parties])
+        matches = matrix[:num_questions, :num_parties] == original_matrix[:num_questions, :num_parties]
+        stats = report["modes"][rag_mode]
+        stats["answered"] = int(answered.sum())
+        stats["agreement_with_original"] = float(matches[answered].mean()) if answered.any() else None
+
+    first, second = (answers[rag_mode][:num_questions, :num_parties] for rag_mode in RAG_MODES)
+    both = ~np.isnan(first) & ~np.isnan(second)
+    report["agreement_between_modes"] = float((first[both] == second[both]).mean()) if both.any() else None
+
+    for rag_mode, stats in report["modes"].items():
+        print(
+            f"{rag_mode:>15}: p50 {stats['latency_p50_s']:.2f}s, p95 {stats['latency_p95_s']:.2f}s, "
+            f"{stats['total_tokens']} tokens, agreement {stats['agreement_with_original']}"
+        )
+    print(f"Agreement between modes: {report['agreement_between_modes']}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Import-time budget of our modules. Each one is imported in a fresh interpreter under
+`python -X importtime`; the check fails if a module takes longer than its budget, or pulls
+in a heavy library it should only load on first use (plots, analytics and the run store
+must not need llama_index, openai or matplotlib just to start):
+
+    python src/check_import_time.py
+    python src/check_import_time.py --verbose gpt_interface
+
+Exits with status 1 if any module is over budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Libraries that take a large share of a second (or more) to import
+HEAVY = ("llama_index", "openai", "matplotlib", "seaborn", "aiohttp", "pandas")
+
+# module: (budget in seconds, libraries it must not import)
+BUDGETS = {
+    "config": (0.2, HEAVY),
+    "data_processing": (0.5, HEAVY),
+    "run_store": (0.5, HEAVY),
+    "analytics": (0.5, HEAVY),
+    "matching": (0.5, HEAVY),
+    "visualization": (0.5, HEAVY),
+    "gpt_interface": (1.5, ("llama_index", "matplotlib", "seaborn", "aiohttp")),
+    # These need llama_index itself, but must not read PDFs, build indices or call the API on import
+    "create_index": (5.0, ("matplotlib", "seaborn", "aiohttp")),
+    "query_for_party": (5.0, ("matplotlib", "seaborn", "aiohttp")),
+}
+
+
+def import_profile(module):
+    """(cumulative seconds per imported module, error output or None) of importing module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+    errors = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # Header line
+        name = fields[2].strip()
+        times[name] = max(times.get(name, 0.0), int(fields[1]) / 1e6)
+    return times, ("\n".join(errors) if result.returncode != 0 else None)
+
+
+def check_module(module, budget, forbidden, runs=3, verbose=False):
+    """True if module imports within budget (best of runs, so .pyc compilation doesn't count)."""
+    best = None
+    for _ in range(runs):
+        times, error = import_profile(module)
+        if error is not None:
+            print(f"FAIL {module}: import failed\n{error}")
+            return False
+        if best is None or times.get(module, 0.0) < best.get(module, 0.0):
+            best = times
+
+    seconds = best.get(module, 0.0)
+    loaded = sorted({
+        package for package in forbidden
+        for name in best if name == package or name.startswith(package + ".")
+    })
+    ok = seconds <= budget and not loaded
+    status = "ok  " if ok else "FAIL"
+    print(f"{status} {module:>16}: {seconds * 1000:7.1f} ms (budget {budget * 1000:.0f} ms)"
+          + (f", imports {', '.join(loaded)}" if loaded else ""))
+    if verbose:
+        top_level = {name: t for name, t in best.items() if "." not in name and name != module}
+        for name, t in sorted(top_level.items(), key=lambda item: -item[1])[:8]:
+            print(f"       {t * 1000:7.1f} ms  {name}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of our modules against their budgets")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all with a budget)")
+    parser.add_argument("--runs", type=int, default=3, help="Imports per module; the fastest counts")
+    parser.add_argument("--verbose", action="store_true", help="Show the slowest imports of each module")
+    args = parser.parse_args()
+
+    unknown = [module for module in args.modules if module not in BUDGETS]
+    if unknown:
+        parser.error(f"No budget for {', '.join(unknown)}; known modules: {', '.join(BUDGETS)}")
+
+    results = [
+        check_module(module, *BUDGETS[module], runs=args.runs, verbose=args.verbose)
+        for module in (args.modules or BUDGETS)
+    ]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+
+
+class CellJournal:
+    """
+    Append-only JSONL journal of finished (party, question) cells. Every line is flushed
+    as soon as the cell completes, so a crashed or interrupted run loses nothing, and a
+    restart only has to ask for the cells that are missing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def load(self):
+        """{(i, j): record} of every journaled cell; later lines win, a torn last line is ignored."""
+        cells = {}
+        if not os.path.exists(self.path):
+            return cells
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cells[(record["i"], record["j"])] = record
+        return cells
+
+    def append(self, i, j, response, status):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"i": i, "j": j, "status": status, "response": response}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_journal_path(checkpoint_dir, filepath, settings):
+    """
+    Journal file for a run: same party file contents and same settings resume the same journal.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        digest.update(f.read())
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return os.path.join(checkpoint_dir, f"run_{digest.hexdigest()[:16]}.jsonl")
@@ -1,28 +1,90 @@
 import os
 from dotenv import load_dotenv
-import openai
 
 # Load environment variables from the .env file located in the src directory
 load_dotenv(dotenv_path='src/.env')
 
 # Retrieve the API key from the environment variables
 api_key = os.getenv("OPENAI_API_KEY")
-openai_client = openai.OpenAI(api_key=api_key)
+# Point this at a local mock server (see mock_openai_server.py) to run without the real API
+openai_base_url = os.getenv("OPENAI_BASE_URL")
 
-# Check if the API key is loaded correctly
-if not api_key:
-    raise ValueError("API key not found. Please ensure the .env file is set up correctly.")
+# The OpenAI client is built on first use, so scripts that only read files (plots,
+# analytics) start without importing openai or needing an API key
+_openai_client = None
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        # Check if the API key is loaded correctly
+        if not api_key:
+            raise ValueError("API key not found. Please ensure the .env file is set up correctly.")
+
+        import openai
+
+        # Initialize the OpenAI client with the API key
+        openai.api_key = api_key
+        _openai_client = openai.OpenAI(api_key=api_key, base_url=openai_base_url)
+    return _openai_client
+
+
+def __getattr__(name):
+    # config.openai_client still works, built on first access
+    if name == "openai_client":
+        return get_openai_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Initialize the OpenAI client with the API key
-openai.api_key = api_key
 
 # Model specifications and cutoffs
 modelspec = "gpt-4o"  # gpt-4, gpt-4o, gpt-4o-mini
 cutoff_questions = 38
 cutoff_parties = 1
 is_rag_context = True
+party_scoped_retrieval = True  # Only retrieve chunks from the asked party's own documents
+rag_mode = "tree_summarize"  # "tree_summarize" or "retrieval_only" (skip the LLM summary, pass only the source texts)
+structured_output = True  # Ask for answers through a strict JSON schema (response_format) instead of free text
+max_repair_attempts = 2  # Follow-up requests for an answer that could not be parsed; cells still unparsed are NaN
+batched_retrieval = True  # Embed all questions in one batch and retrieve every cell's sources before the chat calls
 
 # New configuration options
 disable_parallelization = True  # Set to True to disable parallel processing
+use_async = False  # Set to True to send requests concurrently with asyncio (takes precedence over the options above)
+async_max_concurrency = 16  # Maximum number of requests in flight in async mode
+requests_per_minute = 500  # Request rate limit for async mode (0 disables it)
+tokens_per_minute = 30000  # Token rate limit for async mode (0 disables it)
 chunk_size = 512  # Size of each chunk
-chunk_overlap = 50  # Overlap between chunks
\ No newline at end of file
+chunk_overlap = 50  # Overlap between chunks
+ingestion_workers = None  # Processes extracting and chunking PDFs (None = all cores)
+embed_batch_size = 100  # Chunks per embedding request
+embed_tokens_per_request = 50000  # Token budget per embedding request
+embed_concurrency = 4  # Embedding requests in flight
+classify_concurrency = 4  # Documents classified by the LLM in parallel
+embedding_cache_path = "embedding_cache.sqlite"  # Vectors by chunk text hash, reused across rebuilds
+party_index_cache_size = 8  # Per-party indices kept loaded by query_for_party (least recently used are dropped)
+party_index_cache_mb = 1024  # Upper bound on the on-disk size of the loaded per-party indices
+
+# Local stance and matching service (see stance_server.py)
+server_host = "127.0.0.1"
+server_port = 8080
+retrieval_batch_window_ms = 5  # Retrievals arriving within this window are searched together
+retrieval_batch_max = 64  # A batch is searched as soon as it has this many queries
+
+# Finished cells are journaled here so an interrupted run can resume
+checkpoint_dir = "checkpoints"
+retry_failed_cells = True  # On resume, ask again for cells whose answer could not be parsed
+
+# Structured JSONL log of every retrieval and completion
+interaction_log_path = "llm_interaction_log.jsonl"
+
+# Every run's answers, confidences, reasons and settings (see run_store.py)
+run_store_path = "runs.sqlite"
+
+# Per-stage timings and token usage of the last execute_calc2 run (None disables the file)
+metrics_json_path = "run_metrics.json"
+metrics_prometheus_path = "run_metrics.prom"
+
+# LLM response cache
+llm_cache_mode = "readwrite"  # "readwrite", "replay" (only serve cached responses, never call the API) or "off"
+llm_cache_path = "llm_cache.sqlite"
+llm_cache_max_mb = 500  # Least recently used responses are evicted above this size
+llm_cache_max_age_days = 90  # Responses older than this are evicted
@@ -1,22 +1,109 @@
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, load_index_from_storage
-from llama_index.core.node_parser import SimpleNodeParser
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode
 from tqdm import tqdm
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import json
 import os
-from config import openai_client, modelspec, chunk_size, chunk_overlap
+import re
+import time
+from numpy_vector_store import NumpyVectorStore
+from ingestion import iter_chunked_pdfs, batched
+from embedding_cache import BatchEmbedder, EmbeddingCache
+from storage import file_sha256
+from config import (
+    modelspec, chunk_size, chunk_overlap, embed_batch_size, ingestion_workers,
+    embedding_cache_path, embed_tokens_per_request, embed_concurrency, classify_concurrency,
+)
+from llm_cache import cached_chat_completion, invalidate_cached_response
 
 # Define chunk size parameters
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
-print("Loading documents...")
-documents = SimpleDirectoryReader("downloaded_pdfs").load_data()
+PDF_DIR = "downloaded_pdfs"
+INDEX_DIR = "index_store"
+# Content hash of every indexed file plus the settings its chunks were built with
+MANIFEST_PATH = os.path.join(INDEX_DIR, "manifest.json")
+# Party and document type of every classified file, by content hash
+DOCUMENT_METADATA_PATH = os.path.join(INDEX_DIR, "document_metadata.json")
+
+
+def index_settings():
+    """Everything that changes the chunks or their vectors; a change means a full rebuild."""
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embed_model": getattr(Settings.embed_model, "model_name", type(Settings.embed_model).__name__),
+    }
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {"settings": None, "files": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def reset_manifest():
+    """Forget what was indexed; until the next save, an [u]pdate rebuilds everything."""
+    if os.path.exists(MANIFEST_PATH):
+        os.remove(MANIFEST_PATH)
 
 
+def save_manifest(settings, file_hashes):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "files": file_hashes}, f, indent=2, sort_keys=True)
 
-def generate_llm_based_metadata(documents):
+
+# Keyword phrases per party, matched as whole words against file names and first pages
+KNOWN_PARTIES = {
+    "CDU/CSU": ["cdu", "csu", "christlich demokratische union", "christlich soziale union"],
+    "SPD": ["spd", "sozialdemokratische partei deutschlands"],
+    "BÜNDNIS 90/DIE GRÜNEN": ["grüne", "gruene", "bündnis 90", "buendnis 90"],
+    "FDP": ["fdp", "freie demokraten", "freie demokratische partei"],
+    "AfD": ["afd", "alternative für deutschland", "alternative fuer deutschland"],
+    "DIE LINKE": ["die linke", "linkspartei"],
+    "BSW": ["bsw", "bündnis sahra wagenknecht", "buendnis sahra wagenknecht"],
+    "FREIE WÄHLER": ["freie wähler", "freie waehler"],
+    "Volt": ["volt"],
+    "ÖDP": ["ödp", "oedp", "ökologisch demokratische partei"],
+}
+MANIFESTO_KEYWORDS = ["wahlprogramm", "regierungsprogramm", "europawahlprogramm", "grundsatzprogramm"]
+
+
+def _keyword_hits(text, phrases):
+    return sum(len(re.findall(rf"(?<![\wäöüß]){re.escape(phrase)}(?![\wäöüß])", text)) for phrase in phrases)
+
+
+def preclassify_document(file_name, text_sample):
     """
-    Generate metadata for each document using GPT to identify party and document type
-    from the first pages of each PDF.
+    Deterministic classification from the file name and first page, for the common case
+    where the party is obvious. Returns None when not confident, so the LLM decides.
+    """
+    name = re.sub(r"[-_.]+", " ", file_name.lower())
+    sample = text_sample.lower()
+
+    if not any(keyword in name or keyword in sample for keyword in MANIFESTO_KEYWORDS):
+        return None
+
+    # One party named in the file name settles it
+    named = [party for party, phrases in KNOWN_PARTIES.items() if _keyword_hits(name, phrases)]
+    if len(named) == 1:
+        return {"party": named[0], "doc_type": "manifesto"}
+    if named:
+        return None
+
+    # Otherwise one party has to dominate the first page
+    counts = sorted(((_keyword_hits(sample, phrases), party) for party, phrases in KNOWN_PARTIES.items()), reverse=True)
+    (best, party), (runner_up, _) = counts[0], counts[1]
+    if best >= 3 and best >= 3 * runner_up:
+        return {"party": party, "doc_type": "manifesto"}
+    return None
+
+
+def classify_document(text_sample, max_retries=3):
+    """
+    Use GPT to identify party and document type from the first pages of a PDF.
     """
     system_prompt = (
         "You are a helpful assistant that classifies German political documents. "
@@ -26,108 +113,193 @@ def generate_llm_based_metadata(documents):
         "Output your answer in JSON with keys 'party' and 'doc_type'."
     )
 
-    for doc in tqdm(documents, desc="Generating document metadata"):
-        # Extract first portion of text (roughly 2 pages worth)
-        text_sample = doc.text[:4000]  # Adjust size as needed
-        
-        user_prompt = (
-            "Here is text from the beginning of a German political document:\n\n"
-            f"{text_sample}\n\n"
-            "Please identify:\n"
-            "- which German political party this document belongs to\n"
-            "- the type of document\n"
-            "Return JSON: { \"party\": \"...\", \"doc_type\": \"...\" }"
-        )
+    user_prompt = (
+        "Here is text from the beginning of a German political document:\n\n"
+        f"{text_sample}\n\n"
+        "Please identify:\n"
+        "- which German political party this document belongs to\n"
+        "- the type of document\n"
+        "Return JSON: { \"party\": \"...\", \"doc_type\": \"...\" }"
+    )
+    request = dict(
+        model=modelspec,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.2
+    )
 
+    for attempt in range(max_retries):
         try:
-            response = openai_client.chat.completions.create(
-                model=modelspec,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.2
-            )
+            response = cached_chat_completion(**request)
             content = response.choices[0].message.content
-            
+
             # Parse LLM response
-            import json
-            metadata_dict = json.loads(content)
-            
-            # Attach metadata to document
-            doc.metadata["party"] = metadata_dict.get("party", "Unknown")
-            doc.metadata["doc_type"] = metadata_dict.get("doc_type", "Unknown")
-            
-            print(f"Identified: {metadata_dict}")
-            
+            try:
+                metadata_dict = json.loads(content)
+            except json.JSONDecodeError:
+                invalidate_cached_response(request)  # Ask again instead of replaying the bad answer
+                raise
+            return {
+                "party": metadata_dict.get("party", "Unknown"),
+                "doc_type": metadata_dict.get("doc_type", "Unknown"),
+            }
+
         except Exception as e:
-            print(f"Error processing document: {e}")
-            doc.metadata["party"] = "Unknown"
-            doc.metadata["doc_type"] = "Unknown"
-
-    return documents
-
-
-
-
-# Generate metadata for documents
-print("\nAnalyzing documents for metadata...")
-documents = generate_llm_based_metadata(documents)
-
-# Initialize response variable
-response = 'o'  # default to overwrite, needed to not cause error
-
-# Check for existing index
-if os.path.exists("index_store"):
-    response = input("Existing index found. Do you want to: [o]verwrite, [u]pdate, or [c]ancel? ")
-    if response.lower() == 'c':
-        print("Aborting...")
-        exit()
-    elif response.lower() == 'u':
-        # Load existing index
-        storage_context = StorageContext.from_defaults(persist_dir="index_store")
-        index = load_index_from_storage(storage_context)
-        existing_nodes = index.docstore.docs.values()
-        existing_doc_ids = {node.metadata['file_name'] for node in existing_nodes if 'file_name' in node.metadata}
-        
-        # Filter out documents that are already indexed
-        new_documents = [doc for doc in documents if doc.metadata['file_name'] not in existing_doc_ids]
-        if not new_documents:
-            print("No new documents to index.")
-            exit()
-        
-        print(f"Found {len(new_documents)} new documents to index")
-        documents = new_documents
-
-# Create a node parser with custom chunk size
-node_parser = SimpleNodeParser.from_defaults(
-    chunk_size=chunk_size,
-    chunk_overlap=chunk_overlap
-)
+            print(f"Error processing document (attempt {attempt + 1}/{max_retries}): {e}")
+            if attempt + 1 < max_retries:
+                time.sleep(2 ** attempt)
+
+    return {"party": "Unknown", "doc_type": "Unknown"}
 
-# Parse documents into nodes (chunks) with progress bar
-print("Generating chunks...")
-nodes = []
-for doc in tqdm(documents, desc="Processing documents", unit="doc"):
-    doc_nodes = node_parser.get_nodes_from_documents([doc])
-    # Propagate document metadata to chunks
-    for node in doc_nodes:
-        node.metadata["party"] = doc.metadata.get("party", "Unknown")
-        node.metadata["doc_type"] = doc.metadata.get("doc_type", "Unknown")
-    nodes.extend(doc_nodes)
-
-print(f"Generated {len(nodes)} chunks in total")
-
-print("Creating/Updating index...")
-with tqdm(total=len(nodes), desc="Indexing chunks", unit="chunk") as pbar:
+
+def load_document_metadata():
+    if not os.path.exists(DOCUMENT_METADATA_PATH):
+        return {}
+    with open(DOCUMENT_METADATA_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_document_metadata(known):
+    with open(DOCUMENT_METADATA_PATH, "w", encoding="utf-8") as f:
+        json.dump(known, f, indent=2, ensure_ascii=False, sort_keys=True)
+
+
+def generate_llm_based_metadata(chunked_files, file_hashes):
+    """
+    Classify each chunked file once, from the first ~4000 characters of its text, and
+    propagate party and document type to all of its chunks. Files seen before (by content
+    hash) reuse their stored result, obvious cases are settled by keyword rules, and the
+    rest go to the LLM, classify_concurrency at a time, while the stream keeps flowing.
+    """
+    known = load_document_metadata()
+
+    def classify(file_name, text_sample):
+        digest = file_hashes.get(file_name)
+        if digest in known:
+            return known[digest]
+        metadata = preclassify_document(file_name, text_sample)
+        source = "rules"
+        if metadata is None:
+            metadata = classify_document(text_sample)
+            source = "llm"
+        print(f"Identified ({source}) {file_name}: {metadata}")
+        if digest is not None and metadata["party"] != "Unknown":
+            known[digest] = dict(metadata, file_name=file_name, source=source)
+        return metadata
+
+    def tagged_nodes(future, nodes):
+        metadata = future.result()
+        for node in nodes:
+            node.metadata["party"] = metadata["party"]
+            node.metadata["doc_type"] = metadata["doc_type"]
+        return nodes
+
+    pending = {}
+    try:
+        with ThreadPoolExecutor(max_workers=classify_concurrency) as pool:
+            for file_name, text_sample, nodes in chunked_files:
+                pending[pool.submit(classify, file_name, text_sample)] = nodes
+                if len(pending) >= 2 * classify_concurrency:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from tagged_nodes(future, pending.pop(future))
+            for future in as_completed(list(pending)):
+                yield from tagged_nodes(future, pending.pop(future))
+    finally:
+        # Keep what was classified even if the run is interrupted
+        save_document_metadata(known)
+
+
+def main():
+    # Hashing is cheap; only files whose hash changed get parsed, classified and embedded
+    file_hashes = {
+        file_name: file_sha256(os.path.join(PDF_DIR, file_name))
+        for file_name in sorted(os.listdir(PDF_DIR))
+        if file_name.lower().endswith(".pdf")
+    }
+    settings = index_settings()
+
+    # Initialize response variable
+    response = 'o'  # default to overwrite, needed to not cause error
+
+    # Check for existing index
+    if os.path.exists(INDEX_DIR):
+        response = input("Existing index found. Do you want to: [o]verwrite, [u]pdate, or [c]ancel? ")
+        if response.lower() == 'c':
+            print("Aborting...")
+            return
+
+    to_index = sorted(file_hashes)
     if response.lower() == 'u':
-        # Add new nodes to existing index
-        index.insert_nodes(nodes)
-    else:
-        # Create new index
-        index = VectorStoreIndex(nodes=nodes)
-    pbar.update(len(nodes))
-
-print("Persisting index to disk...")
-index.storage_context.persist(persist_dir="index_store")
-print("Done!")
+        manifest = load_manifest()
+        if manifest["settings"] != settings:
+            print("Chunking or embedding settings changed since the last build, rebuilding the whole index")
+            response = 'o'
+        else:
+            # Load existing index
+            vector_store = NumpyVectorStore.from_persist_dir(INDEX_DIR)
+            vector_store.recover()
+
+            indexed = manifest["files"]
+            to_index = [name for name, digest in file_hashes.items() if indexed.get(name) != digest]
+            removed = [name for name in indexed if name not in file_hashes]
+            if not to_index and not removed:
+                print("No new or changed documents to index.")
+                return
+
+            # The store no longer matches the manifest from here until it is persisted
+            reset_manifest()
+            # Drop the chunks of changed and deleted files before adding the new versions
+            for file_name in to_index + removed:
+                vector_store.delete_file(file_name)
+            print(f"Found {len(to_index)} new or changed and {len(removed)} removed documents")
+
+    if response.lower() != 'u':
+        # An interrupted rebuild must not leave the old manifest describing an empty store
+        reset_manifest()
+        # Create new index; embeddings go to a memory-mapped .npy, node text to a side table
+        vector_store = NumpyVectorStore(persist_dir=INDEX_DIR, overwrite=True)
+
+    # Streaming pipeline: PDFs are extracted and chunked in a process pool, classified
+    # as they arrive and embedded in bounded batches, so only a few files are in memory
+    print(f"Indexing {len(to_index)} documents...")
+    skipped = []
+    chunked_files = iter_chunked_pdfs(
+        [os.path.join(PDF_DIR, name) for name in to_index], chunk_size, chunk_overlap, max_workers=ingestion_workers,
+        skipped=skipped,
+    )
+    # Unchanged chunks are served from the embedding cache; each group fans out into
+    # embed_concurrency requests packed up to embed_tokens_per_request tokens
+    embedder = BatchEmbedder(
+        Settings.embed_model, EmbeddingCache(embedding_cache_path), embed_tokens_per_request, embed_concurrency
+    )
+    total_chunks = 0
+    with tqdm(desc="Indexing chunks", unit="chunk") as pbar:
+        for batch in batched(generate_llm_based_metadata(chunked_files, file_hashes), embed_batch_size * embed_concurrency):
+            embedder.embed_nodes(batch, MetadataMode.EMBED)
+            vector_store.add(batch)
+            vector_store.flush_rows()  # Chunk text goes to disk now, not at the end
+            total_chunks += len(batch)
+            pbar.update(len(batch))
+    print(f"Indexed {total_chunks} chunks in total")
+    embed_stats = embedder.stats()
+    print(
+        f"Embedding: {embed_stats['chunks_per_second']:.1f} chunks/s, "
+        f"{embed_stats['cache_hit_rate']:.0%} cache hits, {embed_stats['requests']} requests"
+    )
+
+    print("Persisting index to disk...")
+    # Rows are append-only; an update only tombstones replaced chunks, so processes that
+    # still have the old matrix mapped keep getting correct rows. [o]verwrite reclaims the space.
+    vector_store.persist()
+    if skipped:
+        print(f"Skipped {len(skipped)} unreadable documents; they are tried again on the next [u]pdate")
+    # Skipped files stay out of the manifest, so an update picks them up once they are readable
+    save_manifest(settings, {name: digest for name, digest in file_hashes.items() if name not in skipped})
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()
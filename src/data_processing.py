@@ -1,7 +1,9 @@
 import json
+import os
 import re
 import numpy as np
 from config import cutoff_questions, cutoff_parties
+from interaction_log import log_event
 import pprint as pp
 
 
@@ -9,47 +11,144 @@ def clean_json_string(json_string):
     json_string = re.sub(r'[\x00-\x1F\x7F]', '', json_string)
     return json_string
 
-def SpecsOfData(file_path):
+def read_party_json(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         raw_data = file.read()
         cleaned_data = clean_json_string(raw_data)
-        data_Party = json.loads(cleaned_data)
-    
-    party_names = data_Party['party_names']
-    full_party_names = data_Party['party_full_names']
-
-    unique_questions = []
-    for answer in data_Party['party_answers']:
-        if answer['Party_Name'] == party_names[0]:
-            unique_questions.append(answer['Question_Label'])
-
-    num_unique_questions = len(unique_questions)
-    party_names_length = len(party_names)
+        return json.loads(cleaned_data)
+
+
+# Prompt templates for a single (question, party) cell
+MESSAGE_TEMPLATE = "question: {question}"
+BEHAVIOUR_TEMPLATE = (
+    'You are the political party {full_party_name} from {country}. '
+    'You will be asked a question that you have to answer in this JSON format: '
+    '"question" : "{question}", '
+    '"Full Party Name" : "{full_party_name}", '
+    '"AI_answer" : "<MUST BE EXACTLY ONE OF: disagree, neutral, agree>", '
+    '"AI_answer_reason" : "<your reasoning for your answer above, 2 sentences max.>", '
+    '"AI_confidence" : "<An integer number between 0 and 100 of the confidence of your answer>"'
+)
+
+ANSWERS = ("disagree", "neutral", "agree")
+
+# Structured-output schema of the answer described in BEHAVIOUR_TEMPLATE
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "Full Party Name": {"type": "string"},
+        "AI_answer": {"type": "string", "enum": list(ANSWERS)},
+        "AI_answer_reason": {"type": "string"},
+        "AI_confidence": {"type": "integer"},
+    },
+    "required": ["question", "Full Party Name", "AI_answer", "AI_answer_reason", "AI_confidence"],
+    "additionalProperties": False,
+}
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "party_answer", "strict": True, "schema": ANSWER_SCHEMA},
+}
+
+# Follow-up when an answer could not be parsed
+REPAIR_MESSAGE = (
+    "Your previous reply could not be parsed. Reply again with only the JSON object in the "
+    'requested format, where "AI_answer" is exactly one of: disagree, neutral, agree.'
+)
+
+
+class PartyDataset:
+    """
+    Party answer file parsed once. Questions and parties are cut off as configured
+    (unless cutoffs is False), prompts are only built for the cell that is actually asked.
+    """
+
+    def __init__(self, file_path, country="Germany", cutoffs=True):
+        self.file_path = file_path
+        self.country = country
+        self.data = read_party_json(file_path)
+        self.party_answers = self.data['party_answers']
+
+        party_names = self.data['party_names']
+        full_party_names = self.data['party_full_names']
+
+        questions = []
+        for answer in self.party_answers:
+            if answer['Party_Name'] == party_names[0]:
+                questions.append(answer['Question_Label'])
+
+        if cutoffs and cutoff_questions != 0:
+            questions = questions[:cutoff_questions]
+        if cutoffs and cutoff_parties != 0:
+            full_party_names = full_party_names[:cutoff_parties]
+            party_names = party_names[:cutoff_parties]
+
+        self.party_names = party_names
+        self.full_party_names = full_party_names
+        self.questions = questions
+
+    @property
+    def num_parties(self):
+        return len(self.party_names)
+
+    @property
+    def num_questions(self):
+        return len(self.questions)
+
+    def message(self, question_idx):
+        return MESSAGE_TEMPLATE.format(question=self.questions[question_idx])
+
+    def behaviour(self, question_idx, party_idx):
+        return BEHAVIOUR_TEMPLATE.format(
+            country=self.country,
+            question=self.questions[question_idx],
+            full_party_name=self.full_party_names[party_idx],
+        )
+
+    def answer_matrix(self):
+        """questions x parties matrix of the parties' own answers (-1, 0, 1); NaN where a party gave none."""
+        matrix = np.full((self.num_questions, self.num_parties), np.nan)
+        rows = {question: j for j, question in enumerate(self.questions)}
+        cols = {party: i for i, party in enumerate(self.party_names)}
+        for answer in self.party_answers:
+            j = rows.get(answer['Question_Label'])
+            i = cols.get(answer['Party_Name'])
+            if i is not None and j is not None and answer.get('Party_Answer') in (-1, 0, 1):
+                matrix[j][i] = answer['Party_Answer']
+        return matrix
+
+    def specs(self):
+        # Same tuple SpecsOfData always returned; the counts follow the configured cutoffs
+        return (
+            self.country,
+            cutoff_parties if cutoff_parties != 0 else self.num_parties,
+            cutoff_questions if cutoff_questions != 0 else self.num_questions,
+            self.data,
+            self.party_names,
+            self.full_party_names,
+            self.questions,
+            self.party_answers
+        )
+
+
+_datasets = {}
+
+def load_dataset(file_path, cutoffs=True):
+    """
+    Return the shared PartyDataset for file_path, re-parsing only if the file changed.
+    cutoffs=False gives every party and question, e.g. for matching voters.
+    """
+    path = os.path.abspath(file_path)
+    key = (path, cutoffs)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _datasets.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, PartyDataset(file_path, cutoffs=cutoffs))
+        _datasets[key] = cached
+    return cached[1]
 
-
-
-   
-    if cutoff_questions != 0:
-        unique_questions = unique_questions[:cutoff_questions]
-        num_unique_questions = cutoff_questions
-    
-
-    if cutoff_parties != 0:
-        full_party_names = full_party_names[:cutoff_parties]
-        party_names = party_names[:cutoff_parties]
-        party_names_length = cutoff_parties
-
-    #print(unique_questions)
-    return (
-        "Germany",
-        party_names_length,
-        num_unique_questions,
-        data_Party,
-        party_names, 
-        full_party_names,
-        unique_questions,
-        data_Party['party_answers']
-    )
+def SpecsOfData(file_path):
+    return load_dataset(file_path).specs()
 
 def convert_answer_to_number(answer):
     answer_map = {
@@ -60,10 +159,7 @@ def convert_answer_to_number(answer):
     return answer_map.get(answer.lower(), 0)
 
 def load_and_process_data(original_file):
-    with open(original_file, 'r', encoding='utf-8') as file:
-        raw_data = file.read()
-        cleaned_data = clean_json_string(raw_data)
-        original_data = json.loads(cleaned_data)
+    original_data = load_dataset(original_file).data
 
 
     party_names = original_data['party_names']
@@ -78,10 +174,7 @@ def load_and_process_data(original_file):
 
     #questions = list(set(questions))
     #print(questions)
-    with open("llm_interaction_log.txt", "a", encoding="utf-8") as log_file:
-        log_file.write("Questions:\n")
-        for question in questions:
-            log_file.write(f"{question}\n")
+    log_event("questions", questions=questions)
 
 
     num_questions = len(questions)
@@ -112,10 +205,7 @@ def load_and_process_data(original_file):
     return original_matrix, questions, party_names
 
 def create_original_matrix(json_file_path):
-    with open(json_file_path, 'r', encoding='utf-8') as file:
-        raw_data = file.read()
-        cleaned_data = clean_json_string(raw_data)
-        data = json.loads(cleaned_data)
+    data = load_dataset(json_file_path).data
     
     party_names = data['party_names'][:cutoff_parties]
     
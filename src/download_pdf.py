@@ -1,8 +1,48 @@
 import requests
 import os
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Simultaneous downloads in total and per host
+MAX_WORKERS = 8
+MAX_PER_HOST = 2
+CHUNK_SIZE = 1 << 16
+# ETag / Last-Modified of every downloaded file, for conditional re-downloads
+MANIFEST_FILE = ".download_manifest.json"
+
+_host_limits = defaultdict(lambda: threading.Semaphore(MAX_PER_HOST))
+_host_limits_lock = threading.Lock()
+
+
+def host_limit(url):
+    with _host_limits_lock:
+        return _host_limits[urlparse(url).netloc]
+
+
+def create_session():
+    """Session with keep-alive connections and retries on transient errors"""
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), respect_retry_after_header=True)
+    # A session serves one thread, so one connection per host is all it ever uses
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=1, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_sessions = threading.local()
+
+def thread_session():
+    """This thread's session; requests.Session is not thread-safe, so workers don't share one"""
+    if not hasattr(_sessions, "session"):
+        _sessions.session = create_session()
+    return _sessions.session
 
 def create_download_folder():
     """Create a folder for downloaded PDFs if it doesn't exist"""
@@ -11,14 +51,26 @@ def create_download_folder():
         os.makedirs(folder_name)
     return folder_name
 
+def load_manifest(folder):
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def save_manifest(folder, manifest):
+    with open(os.path.join(folder, MANIFEST_FILE), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
 def is_pdf_url(url):
     """Check if URL directly points to a PDF"""
     return url.lower().endswith('.pdf')
 
-def get_pdf_links_from_webpage(url):
+def get_pdf_links_from_webpage(session, url):
     """Extract PDF links from a webpage"""
     try:
-        response = requests.get(url, timeout=10)
+        with host_limit(url):
+            response = session.get(url, timeout=10)
         soup = BeautifulSoup(response.content, 'html.parser')
         pdf_links = []
         
@@ -36,60 +88,122 @@ def get_pdf_links_from_webpage(url):
         print(f"Error processing {url}: {str(e)}")
         return []
 
-def download_pdf(url, folder):
-    """Download a PDF file from a URL"""
+def pdf_filename(url):
+    # Extract filename from URL
+    parsed_url = urlparse(url)
+    filename = os.path.basename(parsed_url.path)
+    
+    # If filename is empty or doesn't end with .pdf, create a valid filename
+    if not filename or not filename.lower().endswith('.pdf'):
+        # Stable across runs, so the manifest entry still matches the file next time
+        filename = f"document_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.pdf"
+    return filename
+
+def assign_filenames(pdf_urls, manifest):
+    """
+    A distinct file name per URL, so concurrent downloads never write the same file. A URL
+    keeps the name the manifest recorded for it; clashing names (wahlprogramm.pdf on two
+    party sites) get the host as prefix, or else the URL digest.
+    """
+    filenames = {}
+    taken = set()
+    # URLs downloaded before claim their recorded names first
+    for url in sorted(pdf_urls, key=lambda url: url not in manifest):
+        name = pdf_filename(url)
+        digest_name = f"document_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.pdf"
+        candidates = [manifest.get(url, {}).get("file"), name, f"{urlparse(url).netloc}_{name}", digest_name]
+        filename = next((candidate for candidate in candidates if candidate and candidate not in taken), digest_name)
+        filenames[url] = filename
+        taken.add(filename)
+    return {url: filenames[url] for url in pdf_urls}
+
+def download_pdf(session, url, folder, manifest, filename=None):
+    """
+    Download a PDF file from a URL, streaming it to disk. If the file is already
+    there, the server is asked for it conditionally and a 304 skips the download.
+    """
     try:
-        # Extract filename from URL
-        parsed_url = urlparse(url)
-        filename = os.path.basename(parsed_url.path)
-        
-        # If filename is empty or doesn't end with .pdf, create a valid filename
-        if not filename or not filename.lower().endswith('.pdf'):
-            filename = f"document_{hash(url)}.pdf"
-            
+        filename = filename or pdf_filename(url)
         filepath = os.path.join(folder, filename)
-        
+
+        headers = {}
+        known = manifest.get(url, {})
+        # Only a file this URL wrote can be validated against its ETag
+        if os.path.exists(filepath) and known.get("file") == filename:
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+
         # Download the file
-        response = requests.get(url, timeout=10)
-        
-        # Check if content is actually PDF
-        if 'application/pdf' in response.headers.get('content-type', '').lower():
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            print(f"Successfully downloaded: {filename}")
-            return True
-        else:
-            print(f"Not a PDF file: {url}")
-            return False
+        with host_limit(url), session.get(url, headers=headers, timeout=10, stream=True) as response:
+            if response.status_code == 304:
+                print(f"Unchanged, skipped: {filename}")
+                return True
+            response.raise_for_status()
+
+            # Check if content is actually PDF
+            if 'application/pdf' not in response.headers.get('content-type', '').lower():
+                print(f"Not a PDF file: {url}")
+                return False
+
+            # Write to a temporary file so an interrupted download never replaces a good one
+            tmp_path = filepath + ".part"
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(tmp_path, filepath)
+
+            manifest[url] = {
+                "file": filename,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+        print(f"Successfully downloaded: {filename}")
+        return True
             
     except Exception as e:
         print(f"Error downloading {url}: {str(e)}")
         return False
 
+def collect_pdf_urls(urls):
+    """Direct PDF URLs plus PDF links found on the listed pages, each URL once"""
+    pdf_urls = [url for url in urls if is_pdf_url(url)]
+    pages = [url for url in urls if not is_pdf_url(url)]
+
+    # If it's a webpage, look for PDF links
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for url, pdf_links in zip(pages, pool.map(lambda page: get_pdf_links_from_webpage(thread_session(), page), pages)):
+            print(f"\nProcessing: {url}")
+            for pdf_url in pdf_links:
+                print(f"Found PDF link: {pdf_url}")
+            pdf_urls.extend(pdf_links)
+
+    # The same manifesto is often linked from several pages
+    return list(dict.fromkeys(pdf_urls))
+
 def main():
     # Create download folder
     download_folder = create_download_folder()
+    manifest = load_manifest(download_folder)
     
     # Read URLs from file
     with open('WahlprogrammeDEURLs.txt', 'r') as file:
         urls = [line.strip() for line in file if line.strip()]
-    
-    # Process each URL
-    for url in urls:
-        print(f"\nProcessing: {url}")
-        
-        # If URL directly points to PDF, download it
-        if is_pdf_url(url):
-            download_pdf(url, download_folder)
-        else:
-            # If it's a webpage, look for PDF links
-            pdf_links = get_pdf_links_from_webpage(url)
-            for pdf_url in pdf_links:
-                print(f"Found PDF link: {pdf_url}")
-                download_pdf(pdf_url, download_folder)
-        
-        # Add a small delay to be nice to servers
-        time.sleep(1)
+
+    pdf_urls = collect_pdf_urls(urls)
+    filenames = assign_filenames(pdf_urls, manifest)
+    print(f"\nDownloading {len(pdf_urls)} PDFs...")
+
+    # Downloads run concurrently; host_limit keeps it polite towards each server
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            results = list(pool.map(
+                lambda url: download_pdf(thread_session(), url, download_folder, manifest, filenames[url]), pdf_urls
+            ))
+    finally:
+        save_manifest(download_folder, manifest)
+    print(f"\n{sum(results)} of {len(pdf_urls)} PDFs up to date")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
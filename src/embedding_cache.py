@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from storage import ProcessLocalConnection
+
+
+class EmbeddingCache:
+    """Persistent text-hash -> float32 vector cache, separate per embedding model."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = ProcessLocalConnection(path, ["CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"])
+
+    @staticmethod
+    def make_key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            conn = self._db.connection()
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                sql = f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})"
+                for key, blob in conn.execute(sql, chunk):
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            conn = self._db.connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            conn.commit()
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token
+    return len(text) // 4 + 1
+
+
+def pack_batches(texts, max_tokens, max_items):
+    """Group text indices into requests of at most max_tokens estimated tokens and max_items inputs."""
+    batch, batch_tokens = [], 0
+    for idx, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) == max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(idx)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+class BatchEmbedder:
+    """
+    Embeds texts through a llama_index embedding model. Cached vectors are reused;
+    the rest are packed into requests by token budget and sent a few at a time.
+    """
+
+    def __init__(self, embed_model, cache, max_tokens_per_request, max_concurrency):
+        self.embed_model = embed_model
+        self.model_name = getattr(embed_model, "model_name", type(embed_model).__name__)
+        self.cache = cache
+        self.max_tokens_per_request = max_tokens_per_request
+        # One of our batches must map onto exactly one request of the model
+        self.max_items = getattr(embed_model, "embed_batch_size", 100)
+        self.max_concurrency = max_concurrency
+        self.embedded = 0
+        self.cache_hits = 0
+        self.requests = 0
+        self.seconds = 0.0
+
+    def embed(self, texts):
+        start = time.perf_counter()
+        keys = [self.cache.make_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        vectors = [cached.get(key) for key in keys]
+
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+        missing_texts = [texts[idx] for idx in missing]
+        batches = list(pack_batches(missing_texts, self.max_tokens_per_request, self.max_items))
+
+        def embed_batch(batch):
+            return batch, self.embed_model.get_text_embedding_batch([missing_texts[idx] for idx in batch])
+
+        new_items = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for batch, embeddings in pool.map(embed_batch, batches):
+                for idx, embedding in zip(batch, embeddings):
+                    vectors[missing[idx]] = embedding
+                    new_items.append((keys[missing[idx]], embedding))
+        if new_items:
+            self.cache.put_many(new_items)
+
+        self.embedded += len(texts)
+        self.cache_hits += len(texts) - len(missing)
+        self.requests += len(batches)
+        self.seconds += time.perf_counter() - start
+        return vectors
+
+    def embed_nodes(self, nodes, metadata_mode):
+        vectors = self.embed([node.get_content(metadata_mode=metadata_mode) for node in nodes])
+        for node, vector in zip(nodes, vectors):
+            node.embedding = [float(value) for value in vector]
+
+    def stats(self):
+        return {
+            "chunks": self.embedded,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": self.cache_hits / self.embedded if self.embedded else 0.0,
+            "requests": self.requests,
+            "chunks_per_second": self.embedded / self.seconds if self.seconds else 0.0,
+        }
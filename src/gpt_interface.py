@@ -1,138 +1,191 @@
+import asyncio
 import json
 import time
 import numpy as np
 import os
-from dotenv import load_dotenv
-import openai
 
-from datetime import datetime
-from pathlib import Path
-from config import openai_client, modelspec, cutoff_parties, cutoff_questions, is_rag_context, disable_parallelization
-from data_processing import SpecsOfData, convert_answer_to_number
-
-from llama_index.core import StorageContext, load_index_from_storage
+from config import modelspec, cutoff_parties, cutoff_questions, is_rag_context, disable_parallelization, use_async, party_scoped_retrieval, batched_retrieval, rag_mode, checkpoint_dir, retry_failed_cells, structured_output, max_repair_attempts, metrics_json_path, metrics_prometheus_path, run_store_path, requests_per_minute, tokens_per_minute
+from data_processing import load_dataset, convert_answer_to_number, ANSWERS, RESPONSE_FORMAT, REPAIR_MESSAGE
+from llm_cache import cached_chat_completion, get_llm_cache, invalidate_cached_response
+from async_engine import RateLimiter, run_chat_requests
+from checkpoint import CellJournal, run_journal_path
+from interaction_log import log_event, start_log, attach_log_queue, prompt_hash
+from run_store import RunStore
+from storage import file_sha256
+from metrics import RunMetrics, cell_record, record_stage, record_tokens, timed_stage
 import multiprocessing as mp
 from functools import partial
 
+# llama_index (through retrieval and numpy_vector_store) is imported by the functions that
+# retrieve, so importing this module stays cheap for scripts that only need the prompts
 
-# Load environment variables from the .env file located in the src directory
-load_dotenv(dotenv_path='src/.env')
 
-# Retrieve the API key from the environment variables
-api_key = os.getenv("OPENAI_API_KEY")
+# The index is loaded on first use, once per process, so pool workers don't
+# re-load it on import or receive a pickled copy with every task
+_index = None
 
-# Initialize the OpenAI client with the API key
-openai.api_key = api_key
+def get_index():
+    global _index
+    if _index is None:
+        from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+        from numpy_vector_store import NumpyVectorStore
 
-# Load the index from storage
-# print("Loading index...")
-storage_context = StorageContext.from_defaults(persist_dir="index_store")
-index = load_index_from_storage(storage_context)
-# print("Index loaded!")
+        # print("Loading index...")
+        if NumpyVectorStore.exists("index_store"):
+            _index = VectorStoreIndex.from_vector_store(NumpyVectorStore.from_persist_dir("index_store"))
+        else:
+            if not os.path.exists(os.path.join("index_store", "docstore.json")):
+                raise FileNotFoundError("No index in index_store (or an interrupted build); run create_index.py first")
+            # Index built before the memory-mapped store; re-run create_index.py to convert it
+            storage_context = StorageContext.from_defaults(persist_dir="index_store")
+            _index = load_index_from_storage(storage_context)
+        # print("Index loaded!")
+    return _index
 
 
 
 # Function to create messages and behaviors for each question and party
 def create_message(filepath):
-    country,num_parties,num_questions,data, party_names,Party_Full_Names, questions, data_Country= SpecsOfData(filepath)
-    
-    messages_list = [["" for _ in range(len(Party_Full_Names))] for _ in range(len(questions))]
-    behaviour_list = [["" for _ in range(len(Party_Full_Names))] for _ in range(len(questions))]
-
-    for i in range(num_questions):
-        for j in range(num_parties):
-            messages_list[i][j] = f"question: {questions[i]}"
-            behaviour_list[i][j] = (
-                f'You are the political party {Party_Full_Names[j]} from {country}. '
-                f'You will be asked a question that you have to answer in this JSON format: '
-                f'"question" : "{questions[i]}", '
-                f'"Full Party Name" : "{Party_Full_Names[j]}", '
-                f'"AI_answer" : "<MUST BE EXACTLY ONE OF: disagree, neutral, agree>", '
-                f'"AI_answer_reason" : "<your reasoning for your answer above, 2 sentences max.>", '
-                f'"AI_confidence" : "<An integer number between 0 and 100 of the confidence of your answer>"'
-          
-            )
+    dataset = load_dataset(filepath)
+
+    messages_list = [[dataset.message(i) for _ in range(dataset.num_parties)] for i in range(dataset.num_questions)]
+    behaviour_list = [[dataset.behaviour(i, j) for j in range(dataset.num_parties)] for i in range(dataset.num_questions)]
 
     return messages_list,behaviour_list
 
 
 
-def AskChatGPT_with_context(filepath, i, j, country, index):
-    message2, behaviour2 = create_message(filepath)
-    
-    # Extract the question from the prepared messages
-    question = message2[j][i].replace("question: ", "")
-    
-    # Create a query engine with more comprehensive retrieval settings
-    query_engine = index.as_query_engine(
-        similarity_top_k=6,  # Retrieve top 5 most relevant chunks
-        response_mode="tree_summarize"  # Synthesize information from multiple chunks
-    )
+def configured_rag_mode(mode=None):
+    """mode, or the rag_mode setting as it is now; read at call time so overrides made after import apply."""
+    return rag_mode if mode is None else mode
+
+
+def build_rag_messages(dataset, i, j, index, rag_mode=None):
+    # i is the party index, j is the question index
+    message = dataset.message(j)
+    behaviour = dataset.behaviour(j, i)
+
+    question = dataset.questions[j]
     
-    # Query with more detailed parameters using reformulated question
-    llm_response = query_engine.query(question)
+    with timed_stage("retrieval"):
+        source_nodes = _prefetched_sources.get((i, j)) if _prefetched_sources else None
+        if source_nodes is None:
+            from retrieval import party_filters, get_retriever
+
+            # Only search the asked party's own documents
+            filters = None
+            if party_scoped_retrieval:
+                filters = party_filters(index, dataset.party_names[i], dataset.full_party_names[i])
+
+            retriever = get_retriever(index, filters, top_k=6)  # Retrieve top 6 most relevant chunks
+            source_nodes = retriever.retrieve(question)
 
-    # Get both the response and source nodes
-    context = str(llm_response)
-    source_nodes = llm_response.source_nodes
+    return rag_context_messages(behaviour, message, question, source_nodes, rag_mode, cell=[i, j])
+
+
+def rag_context_messages(behaviour, message, question, source_nodes, rag_mode=None, cell=None):
+    """Chat messages answering message with the retrieved source_nodes (and their summary) as context."""
+    rag_mode = configured_rag_mode(rag_mode)
+    if rag_mode == "tree_summarize":
+        from retrieval import get_synthesizer
+
+        # Synthesize information from multiple chunks (extra LLM round-trips)
+        synthesizer = get_synthesizer("tree_summarize")
+        with timed_stage("synthesis"):
+            context = str(synthesizer.synthesize(question, nodes=source_nodes))
+    else:
+        # retrieval_only: the raw source texts below are the whole context
+        context = ""
     
     # Build comprehensive context including source information and metadata
     detailed_context = context + "\n\nAdditional relevant information:\n"
     for idx, node in enumerate(source_nodes, 1):
         # Extract the ID and other metadata from the node's metadata
         node_id = node.node.metadata.get('id_', 'Unknown ID')  # Adjusted to match your data structure
-        docstore_data = node.node.metadata  # Assuming this contains the docstore data
         detailed_context += f"\nSource {idx} (ID: {node_id}):\n{node.node.text}\n"
-        
-        # Log the docstore data
-        with open("llm_interaction_log.txt", "a", encoding="utf-8") as log_file:
-            log_file.write(f"question:\n{message2[j][i]}\n\n")
-            log_file.write(f"Docstore Data for Source {idx} (ID: {node_id}):\n")
-            log_file.write(f"{json.dumps(docstore_data, indent=2)}\n\n")
+
+    # Log what was retrieved for this cell
+    log_event(
+        "retrieval",
+        cell=cell,
+        question=message,
+        rag_mode=rag_mode,
+        nodes=[
+            {"node_id": node.node.node_id, "score": node.score, "metadata": node.node.metadata}
+            for node in source_nodes
+        ],
+    )
     
     # Create messages with enhanced context included
     messages = [
-        {"role": "system", "content": behaviour2[j][i] + f"Base your answer primarily on the provided context from party documents.\nRelevant context from party documents:\n{detailed_context}\n\n Use this comprehensive context to inform your response."},
-        {"role": "user", "content": message2[j][i]},
+        {"role": "system", "content": behaviour + f"Base your answer primarily on the provided context from party documents.\nRelevant context from party documents:\n{detailed_context}\n\n Use this comprehensive context to inform your response."},
+        {"role": "user", "content": message},
     ]
-    
-    # Log the prompt and response to a file
-    with open("llm_interaction_log.txt", "a", encoding="utf-8") as log_file:
-        log_file.write("=== LLM Interaction ===\n")
-        log_file.write("Input Messages:\n")
-        for message in messages:
-            if message['role'] == 'user':
-                log_file.write(f"{message['role']}: {message['content']}\n")
-        log_file.write("\n")
-
-    temperature = 0
-    max_tokens = 200
-    # top_p = 0.1
-    # frequency_penalty = 0
-    # presence_penalty = 0
-
-    response = openai_client.chat.completions.create(
-        model=modelspec,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        # top_p=top_p,
-        # frequency_penalty=frequency_penalty,
-        # presence_penalty=presence_penalty
-    )
 
-    response_content = response.choices[0].message.content
+    return messages
 
-    # Log the response content
-    with open("llm_interaction_log.txt", "a", encoding="utf-8") as log_file:
-        log_file.write("Output Response:\n")
-        log_file.write(response_content + "\n")
-        log_file.write("=== End of Interaction ===\n\n")
 
-    country, num_parties, num_questions, data, party_names, Party_Full_Names, questions, data_Country = SpecsOfData(filepath)
-    
-    # Remove ```json and ``` if present
-    response_content = response_content.replace('```json', '').replace('```', '')
+def chat_request(messages, is_rag_context):
+    """Chat completion arguments for messages, with the sampling settings of the RAG or plain prompt."""
+    if is_rag_context:
+        request = dict(
+            model=modelspec,
+            messages=messages,
+            temperature=0,
+            max_tokens=200,
+        )
+    else:
+        request = dict(
+            model=modelspec,
+            messages=messages,
+            temperature=0,
+            max_tokens=200,
+            top_p=0.1,
+            frequency_penalty=0,
+            presence_penalty=0,
+        )
+    if structured_output:
+        # The API then only returns JSON matching the schema, AI_answer restricted to ANSWERS
+        request["response_format"] = RESPONSE_FORMAT
+    return request
+
+
+def build_request(filepath, i, j, is_rag_context, index=None, rag_mode=None):
+    """Chat completion arguments for party i and question j."""
+    with timed_stage("dataset_load"):
+        dataset = load_dataset(filepath)
+
+    if is_rag_context:
+        messages = build_rag_messages(dataset, i, j, index, rag_mode)
+    else:
+        messages = [
+            {"role": "system", "content": dataset.behaviour(j, i)},  # j is question index, i is party index
+            {"role": "user", "content": dataset.message(j)},
+        ]
+    return chat_request(messages, is_rag_context)
+
+
+def log_completion(i, j, request, response, latency):
+    usage = response.usage
+    record_stage("chat_completion", latency)
+    if usage:
+        record_tokens("chat", usage.prompt_tokens, usage.completion_tokens)
+    log_event(
+        "completion",
+        cell=[i, j],
+        model=request["model"],
+        prompt_hash=prompt_hash(request["messages"]),
+        user_message=request["messages"][-1]["content"],
+        latency_s=latency,
+        prompt_tokens=usage.prompt_tokens if usage else None,
+        completion_tokens=usage.completion_tokens if usage else None,
+        response=response.choices[0].message.content,
+    )
+
+
+def parse_response_content(response_content):
+    # Remove ```json and ``` if present (a refusal has no content at all)
+    response_content = (response_content or "").replace('```json', '').replace('```', '')
     try:
         return json.loads(response_content)
     except json.JSONDecodeError:
@@ -140,64 +193,159 @@ def AskChatGPT_with_context(filepath, i, j, country, index):
         return {}
 
 
+def validate_answer(parsed):
+    """parsed with AI_answer normalised to one of ANSWERS, or None if it holds no valid answer."""
+    answer = parsed.get("AI_answer") if isinstance(parsed, dict) else None
+    if not isinstance(answer, str) or answer.strip().lower() not in ANSWERS:
+        return None
+    return dict(parsed, AI_answer=answer.strip().lower())
+
+
+def parse_cell_response(request, response):
+    """The validated answer, or {} if the response holds none."""
+    with timed_stage("json_parse"):
+        parsed = validate_answer(parse_response_content(response.choices[0].message.content))
+    if parsed is None:
+        # Don't let a retry of this cell be served the same broken answer
+        invalidate_cached_response(request)
+        return {}
+    return parsed
+
+
+def repair_request(request, response):
+    """Follow-up to request, showing the model its unparseable reply and asking for the JSON again."""
+    messages = request["messages"] + [
+        {"role": "assistant", "content": response.choices[0].message.content or ""},
+        {"role": "user", "content": REPAIR_MESSAGE},
+    ]
+    return dict(request, messages=messages)
+
+
+def complete_cell(i, j, request):
+    """Ask for one cell's answer, with up to max_repair_attempts follow-ups while it can't be parsed."""
+    for attempt in range(max_repair_attempts + 1):
+        start = time.perf_counter()
+        response = cached_chat_completion(**request)
+        log_completion(i, j, request, response, time.perf_counter() - start)
+        parsed = parse_cell_response(request, response)
+        if parsed or attempt == max_repair_attempts:
+            return parsed
+        request = repair_request(request, response)
+
+
+def AskChatGPT_with_context(filepath, i, j, country, index, rag_mode=None):
+    request = build_request(filepath, i, j, True, index, rag_mode)
+    return complete_cell(i, j, request)
+
+
 
 # Function to ask ChatGPT for an answer to a specific question for a specific party
 def AskChatGPT(filepath, i, j, country):
-    message2, behaviour2 = create_message(filepath)
+    request = build_request(filepath, i, j, False)
+    return complete_cell(i, j, request)
 
-    messages = [
-        {"role": "system", "content": behaviour2[j][i]},  # j is question index, i is party index
-        {"role": "user", "content": message2[j][i]},
-    ]
-    temperature = 0
-    max_tokens = 200 
-    top_p = 0.1
-    frequency_penalty = 0
-    presence_penalty = 0
-
-    # # Uncomment below for actual ChatGPT usage
-    response = openai_client.chat.completions.create(
-        model=modelspec,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty
-    )
-    # print(response.choices[0].message.content)
-    response_content = response.choices[0].message.content
-    # Log the prompt and response
 
-    country,num_parties,num_questions,data, party_names,Party_Full_Names, questions, data_Country= SpecsOfData(filepath)
-    
-    # Remove ```json and ``` if present
-    response_content = response_content.replace('```json', '').replace('```', '')
-    try:
-        return json.loads(response_content)
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON response: {response_content}")
-        return {}
 
 
 
+# Per-process run settings, set by init_worker in the main process and in every pool worker
+_worker_filepath = None
+_worker_is_rag_context = None
+_worker_rag_mode = None
+_prefetched_sources = None
+
+def init_worker(filepath, is_rag_context, prefetched_sources=None, log_queue=None, rag_mode=None):
+    global _worker_filepath, _worker_is_rag_context, _worker_rag_mode, _prefetched_sources
+    if log_queue is not None:
+        attach_log_queue(log_queue)
+    rag_mode = configured_rag_mode(rag_mode)
+    _worker_filepath = filepath
+    _worker_is_rag_context = is_rag_context
+    _worker_rag_mode = rag_mode
+    _prefetched_sources = prefetched_sources
+    # Load everything a task needs once, up front
+    dataset = load_dataset(filepath)
+    if is_rag_context:
+        from retrieval import track_synthesis_tokens, warm_up_retrieval
+
+        if rag_mode == "tree_summarize":
+            track_synthesis_tokens()
+        # Retrievers and synthesizer are built once here and reused by every cell
+        latency = warm_up_retrieval(get_index(), dataset, scoped=party_scoped_retrieval, rag_mode=rag_mode,
+                                    query=prefetched_sources is None)
+        if latency is not None:
+            print(f"Retrieval warm-up: {latency * 1000:.1f} ms per query")
 
 
 def process_question(args):
-    i, j, filepath, country, is_rag_context, index = args
-    try:
-        if is_rag_context:
-            response = AskChatGPT_with_context(filepath, i, j, country, index)
-        else:
-            response = AskChatGPT(filepath, i, j, country)
-        time.sleep(0.1)  # Add a small delay to avoid hitting rate limits
-        return (i, j, response)
-    except Exception as e:
-        print(f"Error processing question: {e}")
-        return (i, j, {})
+    """Answer one cell; returns (i, j, response, timings) with the cell's stage timings and token counts."""
+    i, j = args
+    country = load_dataset(_worker_filepath).country
+    with cell_record() as timings:
+        try:
+            if _worker_is_rag_context:
+                response = AskChatGPT_with_context(_worker_filepath, i, j, country, get_index(), _worker_rag_mode)
+            else:
+                response = AskChatGPT(_worker_filepath, i, j, country)
+            time.sleep(0.1)  # Add a small delay to avoid hitting rate limits
+            return (i, j, response, timings)
+        except Exception as e:
+            print(f"Error processing question: {e}")
+            return (i, j, {}, timings)
+
+
+def process_questions_async(filepath, cells, is_rag_context, index, on_cell, rag_mode=None):
+    """
+    Run all (party, question) cells concurrently on the async client, calling
+    on_cell(i, j, response, timings) as each finishes.
+    """
+    # Each cell's record is filled while its request is built (in a worker thread)
+    # and again when its response comes back on the event loop
+    records = {}
+    # Unparseable answers are asked again in follow-up rounds, max_repair_attempts at most
+    repairs = {}
+    attempts = {}
+
+    def prepare(i, j):
+        with cell_record() as timings:
+            records[(i, j)] = timings
+            return build_request(filepath, i, j, is_rag_context, index, rag_mode)
+
+    def on_result(cell, request, response, error, latency):
+        i, j = cell
+        with cell_record(records.get(cell)) as timings:
+            if error is not None:
+                print(f"Error processing question: {error}")
+                parsed = {}
+            else:
+                log_completion(i, j, request, response, latency)
+                parsed = parse_cell_response(request, response)
+                if not parsed and attempts.get(cell, 0) < max_repair_attempts:
+                    attempts[cell] = attempts.get(cell, 0) + 1
+                    repairs[cell] = repair_request(request, response)
+                    return
+            records.pop(cell, None)
+            on_cell(i, j, parsed, timings)
+
+    async def run_rounds():
+        # One limiter for every round, so repairs don't start with fresh budgets or forget a 429 pause
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        jobs = [((i, j), partial(prepare, i, j)) for i, j in cells]
+        while jobs:
+            await run_chat_requests(jobs, on_result, limiter=limiter)
+            jobs = [(cell, partial(dict, request)) for cell, request in repairs.items()]
+            repairs.clear()
+
+    asyncio.run(run_rounds())
 
 def execute_calc2(filepath):
-    country, party_names_length, num_unique_questions, data_Party, party_names, full_party_names, unique_questions, party_answers = SpecsOfData(filepath)
+    metrics = RunMetrics()
+    # Opening the cache evicts stale responses, here once rather than in every pool worker
+    get_llm_cache()
+
+    # Parse the party file once up front; workers share it through load_dataset
+    with metrics.setup_stage("dataset_load"):
+        country, party_names_length, num_unique_questions, data_Party, party_names, full_party_names, unique_questions, party_answers = load_dataset(filepath).specs()
     
     # Apply cutoffs
     if cutoff_parties > 0:
@@ -210,68 +358,142 @@ def execute_calc2(filepath):
     
     results = []
     
-    # Create a matrix to store answers
-    answer_matrix = np.zeros((num_unique_questions, party_names_length))
+    # Create a matrix to store answers; cells without a valid answer stay NaN
+    answer_matrix = np.full((num_unique_questions, party_names_length), np.nan)
     
-    # Prepare arguments for processing
+    # Prepare arguments for processing; tasks only carry the cell indices
     args_list = [
-        (i, j, filepath, country, is_rag_context, index)
+        (i, j)
         for i in range(party_names_length)
         for j in range(num_unique_questions)
     ]
     
     # Calculate total iterations for progress bar
     total_iterations = len(args_list)
+
+    # Resume from the journal of an interrupted run with the same data and settings
+    run_settings = {
+        "model": modelspec,
+        "is_rag_context": is_rag_context,
+        "rag_mode": rag_mode,
+        "party_scoped_retrieval": party_scoped_retrieval,
+        "structured_output": structured_output,
+        "cutoff_parties": cutoff_parties,
+        "cutoff_questions": cutoff_questions,
+    }
+    journal = CellJournal(run_journal_path(checkpoint_dir, filepath, run_settings))
+    failed_cells = 0
+    for (i, j), record in journal.load().items():
+        if i >= party_names_length or j >= num_unique_questions:
+            continue
+        if record["status"] == "failed":
+            if retry_failed_cells:
+                continue
+            failed_cells += 1
+        results.append((i, j, record["response"]))
+        answer_matrix[j][i] = convert_answer_to_number(record["response"]["AI_answer"]) if record["status"] == "ok" else np.nan
+    if results:
+        done = {(i, j) for i, j, _ in results}
+        args_list = [args for args in args_list if args not in done]
+        print(f"Resuming from {journal.path}: {len(done)} cells done, {len(args_list)} to go")
+
+    # Retrieve sources for all cells at once: one embedding batch, one similarity matrix
+    prefetched_sources = None
+    if is_rag_context and batched_retrieval and args_list:
+        with metrics.setup_stage("index_load"):
+            index = get_index()
+        with metrics.setup_stage("prefetch_sources"):
+            from retrieval import prefetch_sources
+            prefetched_sources = prefetch_sources(index, load_dataset(filepath), scoped=party_scoped_retrieval)
+
+    def record_result(i, j, response, timings=None):
+        nonlocal failed_cells
+        idx = len(results)
+        results.append((i, j, response))
+        # Convert response to numerical value (-1, 0, 1)
+        parsed = validate_answer(response)
+        if parsed is not None:
+            answer_matrix[j][i] = convert_answer_to_number(parsed["AI_answer"])
+            journal.append(i, j, parsed, "ok")
+            metrics.add_cell(i, j, timings)
+        else:
+            print(f"\nNo valid answer for party {i}, question {j}: {response}")
+            answer_matrix[j][i] = np.nan  # Missing, not neutral, so it can't skew the agreement
+            journal.append(i, j, response, "failed")
+            metrics.add_cell(i, j, timings, failed=True)
+            failed_cells += 1
+        
+        # Update and display progress bar
+        progress = int(50 * (idx + 1) / total_iterations)
+        print(f"\rProgress: [{'=' * progress}{' ' * (50-progress)}] {idx + 1}/{total_iterations}", end='')
     
-    if disable_parallelization:
+    if use_async:
+        # Concurrent requests on one event loop, paced by the rate limiter
+        with metrics.setup_stage("warm_up"):
+            init_worker(filepath, is_rag_context, prefetched_sources, rag_mode=rag_mode)
+        index = get_index() if is_rag_context else None
+        before = get_llm_cache().stats()
+        process_questions_async(filepath, args_list, is_rag_context, index, record_result, rag_mode)
+        # The async engine looks responses up on the event loop, outside the cell records
+        after = get_llm_cache().stats()
+        metrics.add_cache_lookups(after["hits"] - before["hits"], after["misses"] - before["misses"])
+    elif disable_parallelization:
         # Sequential processing
-        for idx, args in enumerate(args_list):
-            i, j, response = process_question(args)
-            results.append((i, j, response))
-            # Convert response to numerical value (-1, 0, 1)
-            try:
-                answer_matrix[j][i] = convert_answer_to_number(response["AI_answer"])
-            except:
-                print(f"Error converting answer to number: {response}")
-                answer_matrix[j][i] = 0  # Default to neutral if there's an error
-            
-            # Update and display progress bar
-            progress = int(50 * (idx + 1) / total_iterations)
-            print(f"\rProgress: [{'=' * progress}{' ' * (50-progress)}] {idx + 1}/{total_iterations}", end='')
+        with metrics.setup_stage("warm_up"):
+            init_worker(filepath, is_rag_context, prefetched_sources, rag_mode=rag_mode)
+        for args in args_list:
+            record_result(*process_question(args))
     else:
         # Parallel processing
         num_processes = mp.cpu_count() - 1  # Leave one CPU core free
-        pool = mp.Pool(processes=num_processes)
+        pool = mp.Pool(processes=num_processes, initializer=init_worker, initargs=(filepath, is_rag_context, prefetched_sources, start_log(), rag_mode))
         
-        for idx, (i, j, response) in enumerate(pool.imap_unordered(process_question, args_list)):
-            results.append((i, j, response))
-            # Convert response to numerical value (-1, 0, 1)
-            try:
-                answer_matrix[j][i] = convert_answer_to_number(response["AI_answer"])
-            except:
-                print(f"Error converting answer to number: {response}")
-                answer_matrix[j][i] = 0  # Default to neutral if there's an error
-            
-            # Update and display progress bar
-            progress = int(50 * (idx + 1) / total_iterations)
-            print(f"\rProgress: [{'=' * progress}{' ' * (50-progress)}] {idx + 1}/{total_iterations}", end='')
+        for i, j, response, timings in pool.imap_unordered(process_question, args_list):
+            record_result(i, j, response, timings)
         
         pool.close()
         pool.join()
     
     print()  # New line after progress bar completes
-    # Save the matrix to CSV
-    def save_results_with_incremental_name(base_name):
-        counter = 1
-        file_name = f"{base_name}_{counter}.csv"
-        while os.path.exists(file_name):
-            counter += 1
-            file_name = f"{base_name}_{counter}.csv"
-        np.savetxt(file_name, answer_matrix, delimiter=",")
+    if failed_cells:
+        print(f"{failed_cells} cells have no valid answer (NaN in the results); they are kept in {journal.path} and re-run on the next start if retry_failed_cells is set")
+    metrics.print_summary()
+    if metrics_json_path:
+        metrics.write_json(metrics_json_path)
+    if metrics_prometheus_path:
+        metrics.write_prometheus(metrics_prometheus_path, labels={"model": modelspec, "rag_mode": rag_mode if is_rag_context else "none"})
+    # Save answers, confidences, reasons and settings as one run in the run store
+    confidence_matrix = np.full(answer_matrix.shape, np.nan)
+    reasons = [[None] * party_names_length for _ in range(num_unique_questions)]
+    for i, j, response in results:
+        if np.isnan(answer_matrix[j][i]):
+            continue
+        try:
+            confidence_matrix[j][i] = min(100, max(0, int(response.get("AI_confidence"))))
+        except (TypeError, ValueError):
+            pass
+        reasons[j][i] = response.get("AI_answer_reason")
+    run_id = RunStore().save_run(
+        answer_matrix,
+        confidence_matrix,
+        reasons,
+        **dict(
+            run_settings,
+            is_rag=is_rag_context,
+            rag_mode=rag_mode if is_rag_context else None,
+            data_file=os.path.basename(filepath),
+            data_hash=file_sha256(filepath),
+            party_names=list(party_names),
+            questions=list(unique_questions),
+            metrics=metrics.summary(),
+        ),
+    )
+    print(f"Saved run {run_id} to {run_store_path}")
 
-    if is_rag_context:
-        save_results_with_incremental_name('results_rag')
+    # A complete run needs no journal; keep it while there are failed cells to retry
+    if failed_cells:
+        journal.close()
     else:
-        save_results_with_incremental_name('results_GPT')
+        journal.remove()
     
     return answer_matrix
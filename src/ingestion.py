@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pypdf import PdfReader
+from llama_index.core import Document
+from llama_index.core.node_parser import SimpleNodeParser
+
+# Characters from the start of a file handed to the metadata classifier
+SAMPLE_CHARS = 4000
+
+# Same exclusions SimpleDirectoryReader applies, so chunks embed exactly as before
+EXCLUDED_METADATA_KEYS = ["file_path", "file_type", "file_size"]
+
+
+def extract_pages(path):
+    """(page_label, text) of every page of a PDF."""
+    reader = PdfReader(path)
+    pages = []
+    for page_number, page in enumerate(reader.pages):
+        try:
+            label = reader.page_labels[page_number]
+        except (IndexError, KeyError):
+            label = str(page_number + 1)
+        pages.append((label, page.extract_text() or ""))
+    return pages
+
+
+def chunk_pdf(path, chunk_size, chunk_overlap):
+    """
+    Runs in a worker process: extract and chunk one PDF.
+    Returns (file_name, text_sample, nodes); the full text never leaves the worker.
+    """
+    file_name = os.path.basename(path)
+    metadata = {
+        "file_name": file_name,
+        "file_path": path,
+        "file_type": "application/pdf",
+        "file_size": os.path.getsize(path),
+    }
+    documents = [
+        Document(
+            text=text,
+            metadata=dict(metadata, page_label=label),
+            excluded_embed_metadata_keys=EXCLUDED_METADATA_KEYS,
+            excluded_llm_metadata_keys=EXCLUDED_METADATA_KEYS,
+        )
+        for label, text in extract_pages(path)
+    ]
+    text_sample = "".join(document.text for document in documents)[:SAMPLE_CHARS]
+
+    node_parser = SimpleNodeParser.from_defaults(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    nodes = node_parser.get_nodes_from_documents(documents)
+    return file_name, text_sample, nodes
+
+
+def iter_chunked_pdfs(paths, chunk_size, chunk_overlap, max_workers=None, max_in_flight=None, skipped=None):
+    """
+    Extract and chunk PDFs in a process pool, yielding (file_name, text_sample, nodes) per
+    file as soon as it is done. At most max_in_flight files are being processed or waiting
+    to be consumed, which bounds peak memory regardless of corpus size. Files that can't
+    be read are reported and skipped, their names appended to skipped if given.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * max_workers
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        remaining = iter(paths)
+        pending = {}
+        while True:
+            for path in remaining:
+                pending[pool.submit(chunk_pdf, path, chunk_size, chunk_overlap)] = path
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # One unreadable file must not abort the whole build
+                    print(f"Failed to load file {path} with error: {e}. Skipping...")
+                    if skipped is not None:
+                        skipped.append(os.path.basename(path))
+                    continue
+                yield result
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,87 @@
+import atexit
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+from config import interaction_log_path
+
+_STOP = None
+
+
+class InteractionLog:
+    """
+    Structured JSONL log with a single writer. Records from any thread or pool worker go
+    through one multiprocessing queue; a thread in the main process drains it into one
+    buffered file handle, so lines never interleave and no file is opened per record.
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = mp.Queue()
+        self._thread = threading.Thread(target=self._write_loop, name="interaction-log", daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        with open(self.path, "a", encoding="utf-8", buffering=1 << 16) as log_file:
+            while True:
+                try:
+                    record = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    log_file.flush()
+                    continue
+                if record is _STOP:
+                    break
+                # One bad record must not end the thread and silently drop every later one
+                try:
+                    line = json.dumps(record, ensure_ascii=False)
+                    log_file.write(line + "\n")
+                except Exception as e:
+                    print(f"Interaction log: dropped {record.get('event', 'a')} record: {e}")
+
+    def close(self):
+        self.queue.put(_STOP)
+        self._thread.join()
+
+
+_log = None
+_queue = None
+
+def start_log(path=interaction_log_path):
+    """Start the writer in this (main) process; returns the queue to hand to pool workers."""
+    global _log, _queue
+    if _log is None:
+        _log = InteractionLog(path)
+        _queue = _log.queue
+        atexit.register(_log.close)
+    return _queue
+
+def stop_log():
+    """Write out everything queued so far and stop the writer; the next log_event starts a new one."""
+    global _log, _queue
+    if _log is not None:
+        atexit.unregister(_log.close)
+        _log.close()
+    _log = None
+    _queue = None
+
+def attach_log_queue(log_queue):
+    """Send this process's records to a writer running in another process."""
+    global _queue
+    _queue = log_queue
+
+def log_event(event, **fields):
+    if _queue is None:
+        start_log()
+    record = {"event": event, "time": time.time(), "pid": os.getpid()}
+    record.update(fields)
+    _queue.put(record)
+
+
+def prompt_hash(messages):
+    payload = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import multiprocessing as mp
+import threading
+import time
+
+from openai.types.chat import ChatCompletion
+
+from config import get_openai_client, llm_cache_mode, llm_cache_path, llm_cache_max_mb, llm_cache_max_age_days
+from metrics import record_cache_lookup
+from storage import ProcessLocalConnection
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a request has no cached response."""
+
+
+class LLMCache:
+    """
+    On-disk cache of chat completion responses, keyed by a hash of the full request
+    (model, messages, temperature, max_tokens, ...). Safe to share between processes.
+    """
+
+    def __init__(self, path, mode="readwrite", max_mb=None, max_age_days=None):
+        self.path = path
+        self.mode = mode
+        self.max_mb = max_mb
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = ProcessLocalConnection(path, [
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        ])
+
+    @staticmethod
+    def make_key(request):
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            conn = self._db.connection()
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode != "replay":
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            return row[0]
+
+    def put(self, key, model, response):
+        if self.mode == "replay":
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._db.connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response), now, now),
+            )
+            conn.commit()
+
+    def delete(self, key):
+        if self.mode == "replay":
+            return
+        with self._lock:
+            conn = self._db.connection()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until the cache fits max_mb."""
+        if self.mode == "replay":
+            return 0
+        removed = 0
+        with self._lock:
+            conn = self._db.connection()
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            if self.max_mb:
+                budget = self.max_mb * 1024 * 1024
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > budget:
+                    stale = []
+                    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC"):
+                        if total <= budget:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                    removed += len(stale)
+            conn.commit()
+        return removed
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+
+def get_llm_cache():
+    global _cache
+    if _cache is None:
+        _cache = LLMCache(llm_cache_path, llm_cache_mode, llm_cache_max_mb, llm_cache_max_age_days)
+        # Pool workers share the file with the main process, which evicts it once
+        if llm_cache_mode == "readwrite" and mp.parent_process() is None:
+            _cache.evict()
+    return _cache
+
+
+def _lookup(request):
+    cache = get_llm_cache()
+    key = cache.make_key(request)
+    cached = cache.get(key)
+    # Counted in the current cell's record too, which pool workers send back with the answer
+    record_cache_lookup(cached is not None)
+    if cached is not None:
+        return cache, key, ChatCompletion.model_validate_json(cached)
+    if cache.mode == "replay":
+        raise LLMCacheMiss(f"No cached response for request {key[:12]} (replay mode)")
+    return cache, key, None
+
+
+def cached_chat_completion(**request):
+    """Drop-in for openai_client.chat.completions.create that serves repeated requests from disk."""
+    if llm_cache_mode == "off":
+        return get_openai_client().chat.completions.create(**request)
+
+    cache, key, response = _lookup(request)
+    if response is None:
+        response = get_openai_client().chat.completions.create(**request)
+        cache.put(key, request.get("model"), response.model_dump_json())
+    return response
+
+
+def invalidate_cached_response(request):
+    """Forget the cached response to request, e.g. because it could not be parsed."""
+    if llm_cache_mode != "off":
+        cache = get_llm_cache()
+        cache.delete(cache.make_key(request))
+
+
+async def async_cached_chat_completion(create, **request):
+    """Async counterpart of cached_chat_completion; create(**request) is only awaited on a cache miss."""
+    if llm_cache_mode == "off":
+        return await create(**request)
+
+    cache, key, response = _lookup(request)
+    if response is None:
+        response = await create(**request)
+        cache.put(key, request.get("model"), response.model_dump_json())
+    return response
@@ -3,11 +3,12 @@ from gpt_interface import execute_calc2
 from visualization import create_comparison_plot
 import numpy as np
 import json
+from config import modelspec, is_rag_context
+from interaction_log import log_event
 
 def main():
-    # Add 30 empty lines to the log file at the start of the script
-    with open("llm_interaction_log.txt", "a", encoding="utf-8") as log_file:
-        log_file.write("\n" * 60)
+    # Mark the start of this run in the interaction log
+    log_event("run_start", model=modelspec, rag=is_rag_context)
 
     # Set the cutoffs for parties and questions
     json_file_path = "Party_Answers_Converted_de.json"
@@ -15,7 +16,7 @@ def main():
     # Step 1: Generate AI answers
     print("Generating AI answers...")
     ai_matrix = execute_calc2(json_file_path)
-    print("AI answers generated and saved to 'results.json' and 'results.csv'")
+    print("AI answers generated and saved to the run store")
     
     # Step 2: Load and process both original and AI data
     print("\nProcessing data for comparison...")
@@ -31,13 +32,17 @@ def main():
     # Step 3: Create and save comparison plot
     print("\nCreating comparison plot...")
 
-       # Print statistics
-    agreement = np.sum(original_matrix == ai_matrix)
+       # Print statistics; cells without a valid AI answer (NaN) are left out, not counted as neutral
+    answered = ~np.isnan(ai_matrix)
+    agreement = np.sum(original_matrix[answered] == ai_matrix[answered])
     total = original_matrix.size
+    answered_total = int(answered.sum())
     print(f"\nStatistics:")
     print(f"Total number of answers: {total}")
+    print(f"Missing AI answers: {total - answered_total}")
     print(f"Number of matching answers: {agreement}")
-    print(f"Agreement percentage: {(agreement/total)*100:.2f}%")
+    if answered_total:
+        print(f"Agreement percentage: {(agreement/answered_total)*100:.2f}% of answered cells")
 
 
 
@@ -0,0 +1,99 @@
+import numpy as np
+
+from data_processing import load_dataset
+
+# Voter answer marking a skipped question
+SKIP = -128
+
+
+class PartyMatcher:
+    """
+    Wahl-O-Mat-style matching of voters against the parties' answers. Per question a voter
+    gets 2 points for the party's position, 1 for a neighbouring one (agree/neutral,
+    neutral/disagree) and 0 for the opposite; weighted questions count their weight times.
+    A party's score is its points over the maximum the voter could have got from it.
+    Skipped questions, and questions the party has no answer for, don't count.
+    """
+
+    def __init__(self, party_matrix, party_names, questions=None):
+        party_matrix = np.asarray(party_matrix, dtype=float)  # questions x parties, NaN = no answer
+        self.party_names = list(party_names)
+        self.questions = list(questions) if questions is not None else None
+        self.num_questions, self.num_parties = party_matrix.shape
+
+        # For answers v, p in {-1, 0, 1} the points 2 - |v - p| equal
+        # 2*ans - ans*v^2 + v*p + v^2*p^2 - p^2 (ans: the party answered). With a the
+        # voter's weight of an answered question (0 if skipped), v and v^2 weighted the same
+        # way, the points of all voters and parties are
+        #     a @ (2*ans - p^2) + v @ p + v^2 @ (p^2 - ans)
+        # and the maximum points 2 * a @ ans ride along as extra columns of the first product.
+        answered = ~np.isnan(party_matrix)
+        p = np.where(answered, party_matrix, 0.0)
+        max_terms = 2 * answered
+        if answered.all():
+            max_terms = max_terms[:, :1]  # The same for every party
+        self._answered_terms = np.hstack([2 * answered - p * p, max_terms]).astype(np.float32)
+        self._answer_terms = p.astype(np.float32)
+        self._square_terms = (p * p - answered).astype(np.float32)
+
+    @classmethod
+    def from_party_file(cls, file_path):
+        """Matcher over every party and question of the file; the batch-run cutoffs don't apply."""
+        dataset = load_dataset(file_path, cutoffs=False)
+        return cls(dataset.answer_matrix(), dataset.party_names, dataset.questions)
+
+    def scores(self, voters, weights=None, chunk_size=2048):
+        """
+        voters: N x Q int8 answers (-1 disagree, 0 neutral, 1 agree, SKIP)
+        weights: None, Q or N x Q question weights (e.g. 2 for questions marked important)
+        Returns N x P scores in [0, 1]; NaN where the voter and the party share no answered question.
+        """
+        voters = np.atleast_2d(np.asarray(voters, dtype=np.int8))
+        if voters.shape[1] != self.num_questions:
+            raise ValueError(f"Expected answers to {self.num_questions} questions, got {voters.shape[1]}")
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float32)
+            if weights.ndim == 1:
+                weights = np.broadcast_to(weights, voters.shape)
+
+        result = np.empty((len(voters), self.num_parties), dtype=np.float32)
+        # Chunks keep the float32 intermediates in cache
+        for start in range(0, len(voters), chunk_size):
+            chunk = voters[start:start + chunk_size]
+            a = (chunk != SKIP).astype(np.float32)
+            v = chunk.astype(np.float32)
+            v *= a
+            if weights is not None:
+                w = weights[start:start + chunk_size]
+                a *= w
+                v *= w
+            v2 = np.abs(v)  # v^2 times the weight, as v is -1, 0 or 1
+
+            product = a @ self._answered_terms
+            points = product[:, :self.num_parties]
+            points += v @ self._answer_terms
+            points += v2 @ self._square_terms
+            with np.errstate(invalid="ignore", divide="ignore"):
+                np.divide(points, product[:, self.num_parties:], out=result[start:start + chunk_size])
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+    def rank(self, voters, weights=None, top=None):
+        """(party indices, scores) per voter, best match first; top limits it to the best few."""
+        scores = self.scores(voters, weights)
+        # Unmatchable parties (NaN) rank last
+        keyed = np.where(np.isnan(scores), -np.inf, scores)
+        if top is not None and top < self.num_parties:
+            candidates = np.argpartition(-keyed, top - 1, axis=1)[:, :top]
+            order = np.take_along_axis(candidates, np.argsort(-np.take_along_axis(keyed, candidates, axis=1), axis=1), axis=1)
+        else:
+            order = np.argsort(-keyed, axis=1)
+        return order, np.take_along_axis(scores, order, axis=1)
+
+    def match(self, answers, weights=None):
+        """Ranked [(party name, score)] of a single voter."""
+        order, scores = self.rank(np.asarray(answers, dtype=np.int8)[None, :], None if weights is None else np.asarray(weights)[None, :])
+        return [
+            (self.party_names[idx], None if np.isnan(score) else float(score))
+            for idx, score in zip(order[0], scores[0])
+        ]
@@ -0,0 +1,202 @@
+import contextvars
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+# Per-cell stages, in pipeline order
+STAGES = ("dataset_load", "retrieval", "synthesis", "chat_completion", "json_parse")
+TOKEN_KINDS = ("chat_prompt", "chat_completion", "synthesis_prompt", "synthesis_completion")
+
+# Timing record of the cell being worked on in this thread or task
+_current_cell = contextvars.ContextVar("current_cell", default=None)
+
+
+def new_cell_record():
+    return {"stages": {}, "tokens": dict.fromkeys(TOKEN_KINDS, 0), "llm_cache": {"hits": 0, "misses": 0}}
+
+
+@contextmanager
+def cell_record(record=None):
+    """Collect the stage timings and token counts of one cell into record (a fresh one by default)."""
+    record = record if record is not None else new_cell_record()
+    token = _current_cell.set(record)
+    try:
+        yield record
+    finally:
+        _current_cell.reset(token)
+
+
+def current_cell_record():
+    """The record cell_record is collecting into in this thread or task, or None."""
+    return _current_cell.get()
+
+
+def record_stage(stage, seconds, record=None):
+    record = record if record is not None else _current_cell.get()
+    if record is not None:
+        record["stages"][stage] = record["stages"].get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_tokens(kind, prompt_tokens, completion_tokens, record=None):
+    record = record if record is not None else _current_cell.get()
+    if record is not None:
+        record["tokens"][f"{kind}_prompt"] += prompt_tokens or 0
+        record["tokens"][f"{kind}_completion"] += completion_tokens or 0
+
+
+def record_cache_lookup(hit, record=None):
+    record = record if record is not None else _current_cell.get()
+    if record is not None:
+        record["llm_cache"]["hits" if hit else "misses"] += 1
+
+
+class RunMetrics:
+    """
+    Per-cell stage timings and token usage of one execute_calc2 run, plus one-off setup
+    stages (parsing the party file, prefetching sources, ...), summarised at the end.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.setup = {}
+        self.cells = []
+        self.failed = 0
+        # LLM cache lookups made outside any cell record (e.g. the async engine's)
+        self.cache_lookups = {"hits": 0, "misses": 0}
+
+    @contextmanager
+    def setup_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.setup[stage] = self.setup.get(stage, 0.0) + time.perf_counter() - start
+
+    def add_cache_lookups(self, hits, misses):
+        self.cache_lookups["hits"] += hits
+        self.cache_lookups["misses"] += misses
+
+    def add_cell(self, i, j, record, failed=False):
+        if record is not None:
+            self.cells.append({"cell": [i, j], **record})
+        if failed:
+            self.failed += 1
+
+    def summary(self):
+        wall = time.perf_counter() - self._start
+        stage_values = defaultdict(list)
+        tokens = dict.fromkeys(TOKEN_KINDS, 0)
+        cache = dict(self.cache_lookups)
+        for cell in self.cells:
+            for result, count in cell.get("llm_cache", {}).items():
+                cache[result] += count
+            for stage, seconds in cell["stages"].items():
+                stage_values[stage].append(seconds)
+            for kind, count in cell["tokens"].items():
+                tokens[kind] += count
+
+        busy = sum(sum(values) for values in stage_values.values())
+        stages = {}
+        for stage in [s for s in STAGES if s in stage_values] + [s for s in stage_values if s not in STAGES]:
+            values = np.array(stage_values[stage])
+            stages[stage] = {
+                "count": int(values.size),
+                "total_s": float(values.sum()),
+                "mean_s": float(values.mean()),
+                "p50_s": float(np.percentile(values, 50)),
+                "p95_s": float(np.percentile(values, 95)),
+                "max_s": float(values.max()),
+                # Share of the time spent in all per-cell stages
+                "share": float(values.sum() / busy) if busy else 0.0,
+            }
+        return {
+            "started": self.started,
+            "wall_s": wall,
+            "cells": len(self.cells),
+            "failed_cells": self.failed,
+            "cells_per_second": len(self.cells) / wall if wall else 0.0,
+            "setup_s": dict(self.setup),
+            "stages": stages,
+            "tokens": tokens,
+            "llm_cache": cache,
+        }
+
+    def write_json(self, path, include_cells=True):
+        report = self.summary()
+        if include_cells:
+            report["per_cell"] = self.cells
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    def write_prometheus(self, path, labels=None):
+        """Summary in the Prometheus text exposition format, e.g. for the node exporter's textfile collector."""
+        summary = self.summary()
+        base = dict(labels or {})
+
+        def fmt(extra=None):
+            merged = dict(base, **(extra or {}))
+            if not merged:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in merged.items()) + "}"
+
+        lines = [
+            "# HELP electomate_stage_seconds Wall time per cell and pipeline stage.",
+            "# TYPE electomate_stage_seconds summary",
+        ]
+        for stage, stats in summary["stages"].items():
+            lines.append(f"electomate_stage_seconds{fmt({'stage': stage, 'quantile': '0.5'})} {stats['p50_s']}")
+            lines.append(f"electomate_stage_seconds{fmt({'stage': stage, 'quantile': '0.95'})} {stats['p95_s']}")
+            lines.append(f"electomate_stage_seconds_sum{fmt({'stage': stage})} {stats['total_s']}")
+            lines.append(f"electomate_stage_seconds_count{fmt({'stage': stage})} {stats['count']}")
+        lines += ["# HELP electomate_setup_seconds Wall time of one-off run stages.", "# TYPE electomate_setup_seconds gauge"]
+        for stage, seconds in summary["setup_s"].items():
+            lines.append(f"electomate_setup_seconds{fmt({'stage': stage})} {seconds}")
+        lines += ["# HELP electomate_tokens_total Tokens used by kind.", "# TYPE electomate_tokens_total counter"]
+        for kind, count in summary["tokens"].items():
+            lines.append(f"electomate_tokens_total{fmt({'kind': kind})} {count}")
+        lines += ["# HELP electomate_llm_cache_lookups_total LLM cache lookups by result.", "# TYPE electomate_llm_cache_lookups_total counter"]
+        for result, count in summary["llm_cache"].items():
+            lines.append(f"electomate_llm_cache_lookups_total{fmt({'result': result})} {count}")
+        lines += [
+            "# HELP electomate_cells_total Cells answered in the run.",
+            "# TYPE electomate_cells_total counter",
+            f"electomate_cells_total{fmt()} {summary['cells']}",
+            "# HELP electomate_failed_cells_total Cells whose answer could not be parsed.",
+            "# TYPE electomate_failed_cells_total counter",
+            f"electomate_failed_cells_total{fmt()} {summary['failed_cells']}",
+            "# HELP electomate_run_seconds Wall time of the run.",
+            "# TYPE electomate_run_seconds gauge",
+            f"electomate_run_seconds{fmt()} {summary['wall_s']}",
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"Run: {summary['cells']} cells in {summary['wall_s']:.1f}s ({summary['cells_per_second']:.2f} cells/s)")
+        for stage, seconds in summary["setup_s"].items():
+            print(f"  setup {stage:>16}: {seconds:.2f}s")
+        for stage, stats in summary["stages"].items():
+            print(
+                f"  {stage:>22}: p50 {stats['p50_s'] * 1000:.1f} ms, p95 {stats['p95_s'] * 1000:.1f} ms, "
+                f"{stats['share']:.0%} of cell time"
+            )
+        tokens = summary["tokens"]
+        print(
+            f"  tokens: chat {tokens['chat_prompt']} + {tokens['chat_completion']}, "
+            f"synthesis {tokens['synthesis_prompt']} + {tokens['synthesis_completion']}"
+        )
+        print(f"  LLM cache: {summary['llm_cache']['hits']} hits, {summary['llm_cache']['misses']} misses")
@@ -0,0 +1,193 @@
+"""
+Local stand-in for the OpenAI chat completions and embeddings endpoints, so the query
+engines and the index build can be exercised without spending API credit:
+
+    python src/mock_openai_server.py --port 8765 --latency 0.3 --rate-limit-every 20
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_BASE=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock python src/main.py
+
+OPENAI_BASE_URL is read by our own client, OPENAI_API_BASE by llama_index.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+
+import numpy as np
+from aiohttp import web
+
+ANSWERS = ["disagree", "neutral", "agree"]
+
+
+def mock_embedding(text, dim):
+    """Deterministic unit vector per text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(latency=0.0, rate_limit_every=0, retry_after=1.0, error_rate=0.0, embedding_dim=1536, seed=0):
+    """
+    latency: seconds to wait before answering each request
+    rate_limit_every: answer every n-th request with 429 and a Retry-After header (0 disables)
+    error_rate: fraction of requests answered with a 500
+    embedding_dim: length of the vectors returned by /v1/embeddings
+    """
+    state = {"requests": 0, "rate_limited": 0, "errors": 0, "embedding_inputs": 0}
+    rng = random.Random(seed)
+
+    async def injected_failure():
+        """The 429 or 500 to answer the current request with, if any; otherwise waits out the latency."""
+        state["requests"] += 1
+        if rate_limit_every and state["requests"] % rate_limit_every == 0:
+            state["rate_limited"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429,
+                headers={"Retry-After": str(retry_after)},
+            )
+        if error_rate and rng.random() < error_rate:
+            state["errors"] += 1
+            return web.json_response({"error": {"message": "Injected server error", "type": "server_error"}}, status=500)
+
+        if latency:
+            await asyncio.sleep(latency)
+        return None
+
+    async def chat_completions(request):
+        body = await request.json()
+        failure = await injected_failure()
+        if failure is not None:
+            return failure
+
+        # Deterministic answer per prompt so repeated runs agree with each other
+        prompt = json.dumps(body.get("messages", []), sort_keys=True)
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        content = json.dumps({
+            "AI_answer": ANSWERS[digest[0] % 3],
+            "AI_answer_reason": "Mock answer.",
+            "AI_confidence": digest[1] % 101,
+        })
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return web.json_response({
+            "id": f"chatcmpl-mock-{state['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    async def embeddings(request):
+        body = await request.json()
+        failure = await injected_failure()
+        if failure is not None:
+            return failure
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        state["embedding_inputs"] += len(inputs)
+        data = []
+        for idx, text in enumerate(inputs):
+            vector = mock_embedding(str(text), embedding_dim)
+            # The openai client asks for base64 unless told otherwise
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": idx, "embedding": embedding})
+        tokens = sum(len(str(text)) // 4 for text in inputs)
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "mock"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    async def stats(request):
+        return web.json_response(state)
+
+    app = web.Application()
+    app["state"] = state
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+class MockServerThread:
+    """
+    Runs the mock server on its own event loop in a daemon thread, for benchmarks and
+    scripts that need it in-process:
+
+        server = MockServerThread(latency=0.05).start()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        self.host = host
+        self.port = port
+        self.app = create_app(**options)
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mock-openai", daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def stats(self):
+        return dict(self.app["state"])
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port; read back the one actually bound
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions and embeddings server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.rate_limit_every, args.retry_after, args.error_rate, args.embedding_dim)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
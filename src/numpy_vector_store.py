@@ -0,0 +1,387 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from storage import ProcessLocalConnection
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NODES_FILE = "nodes.sqlite"
+
+# Node metadata keys that get their own column, so filters on them are plain SQL lookups
+INDEXED_KEYS = ("party", "file_name")
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store backed by one contiguous float32 .npy of unit-normalised embeddings,
+    memory-mapped on load, and a SQLite side table with node text and metadata.
+    Row r of the matrix belongs to the node with row = r in the table. Top-k search
+    is a single matrix-vector product; only the k winning nodes are read from SQLite.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+    persist_dir: str
+
+    _embeddings = PrivateAttr(default=None)
+    # Rows not yet in the side table, and vectors not yet in the .npy (a superset of them)
+    _pending_vectors = PrivateAttr(default_factory=list)
+    _pending_count = PrivateAttr(default=0)
+    _pending_rows = PrivateAttr(default_factory=list)
+    _merged = PrivateAttr(default=None)
+    _partitions = PrivateAttr(default_factory=dict)
+    _deleted = PrivateAttr(default_factory=set)
+    _lock = PrivateAttr(default_factory=threading.Lock)
+    _db = PrivateAttr(default=None)
+
+    def __init__(self, persist_dir, overwrite=False, **kwargs):
+        super().__init__(persist_dir=persist_dir, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        if overwrite:
+            for file_name in (EMBEDDINGS_FILE, NODES_FILE):
+                path = os.path.join(persist_dir, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self._db = ProcessLocalConnection(
+            os.path.join(persist_dir, NODES_FILE),
+            [
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                " row INTEGER PRIMARY KEY,"
+                " node_id TEXT UNIQUE NOT NULL,"
+                " ref_doc_id TEXT,"
+                " party TEXT,"
+                " file_name TEXT,"
+                " deleted INTEGER NOT NULL DEFAULT 0,"
+                " node TEXT NOT NULL)"
+            ] + [f"CREATE INDEX IF NOT EXISTS idx_nodes_{key} ON nodes ({key})" for key in ("ref_doc_id",) + INDEXED_KEYS],
+            wal=False,
+            timeout=5.0,
+        )
+
+        embeddings_path = os.path.join(persist_dir, EMBEDDINGS_FILE)
+        if os.path.exists(embeddings_path):
+            # Zero-copy: pages are only read when a query touches them
+            self._embeddings = np.load(embeddings_path, mmap_mode="r")
+        # Opening never writes: rows past the matrix belong to a writer that hasn't
+        # persisted yet (or died), and every query below leaves them out
+        self._deleted = {
+            row for (row,) in self._db.connection().execute(
+                "SELECT row FROM nodes WHERE deleted = 1 AND row < ?", (self._stored_count(),)
+            )
+        }
+
+    @classmethod
+    def class_name(cls):
+        return "NumpyVectorStore"
+
+    @classmethod
+    def exists(cls, persist_dir):
+        return os.path.exists(os.path.join(persist_dir, EMBEDDINGS_FILE))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        return cls(persist_dir=persist_dir)
+
+    @property
+    def client(self):
+        return None
+
+    def recover(self):
+        """
+        Drop rows flushed by a run that died before writing their vectors. Only the
+        process that is about to write may call this; a reader would delete the rows of
+        an update that is still running.
+        """
+        with self._lock:
+            conn = self._db.connection()
+            conn.execute("DELETE FROM nodes WHERE row >= ?", (len(self),))
+            conn.commit()
+
+    def _stored_count(self):
+        return 0 if self._embeddings is None else self._embeddings.shape[0]
+
+    def __len__(self):
+        return self._stored_count() + self._pending_count
+
+    def _matrix(self):
+        """All embeddings, including rows added since the last persist."""
+        if not self._pending_vectors:
+            return self._embeddings
+        if self._merged is None or self._merged.shape[0] != len(self):
+            parts = ([self._embeddings] if self._embeddings is not None else []) + self._pending_vectors
+            self._merged = np.concatenate(parts, axis=0)
+        return self._merged
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            first_row = len(self)
+            for offset, node in enumerate(nodes):
+                metadata = node_to_metadata_dict(node, remove_text=False, flat_metadata=self.flat_metadata)
+                self._pending_rows.append((
+                    first_row + offset,
+                    node.node_id,
+                    node.ref_doc_id,
+                    node.metadata.get("party"),
+                    node.metadata.get("file_name"),
+                    json.dumps(metadata, ensure_ascii=False),
+                ))
+            self._pending_vectors.append(vectors)
+            self._pending_count += len(vectors)
+            self._partitions = {}
+        return [node.node_id for node in nodes]
+
+    def _delete_where(self, column, value):
+        with self._lock:
+            # Rows still waiting to be persisted are dropped from the pending batch directly
+            position = {"ref_doc_id": 2, "file_name": 4}[column]
+            for pending in self._pending_rows:
+                if pending[position] == value:
+                    self._deleted.add(pending[0])
+            conn = self._db.connection()
+            rows = [row for (row,) in conn.execute(f"SELECT row FROM nodes WHERE {column} = ?", (value,))]
+            conn.execute(f"UPDATE nodes SET deleted = 1 WHERE {column} = ?", (value,))
+            conn.commit()
+            self._deleted.update(rows)
+            self._partitions = {}
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        self._delete_where("ref_doc_id", ref_doc_id)
+
+    def delete_file(self, file_name):
+        """Remove every node that was chunked from file_name."""
+        self._delete_where("file_name", file_name)
+
+    def file_names(self):
+        conn = self._db.connection()
+        names = {
+            name for (name,) in conn.execute("SELECT DISTINCT file_name FROM nodes WHERE deleted = 0 AND row < ?", (len(self),))
+        }
+        names.update(pending[4] for pending in self._pending_rows if pending[0] not in self._deleted)
+        names.discard(None)
+        return names
+
+    def parties(self):
+        """Distinct party values in the index, as tagged by create_index.py."""
+        self.flush_rows()
+        conn = self._db.connection()
+        return sorted(party for (party,) in conn.execute(
+            "SELECT DISTINCT party FROM nodes WHERE deleted = 0 AND row < ?", (len(self),)
+        ) if party)
+
+    def party_rows(self, party):
+        """Rows belonging to one party, cached so party-scoped queries skip SQL entirely."""
+        rows = self._partitions.get(party)
+        if rows is None:
+            self.flush_rows()
+            conn = self._db.connection()
+            rows = np.fromiter(
+                (row for (row,) in conn.execute(
+                    "SELECT row FROM nodes WHERE deleted = 0 AND party = ? AND row < ? ORDER BY row", (party, len(self))
+                )),
+                dtype=np.int64,
+            )
+            self._partitions[party] = rows
+        return rows
+
+    def filter_rows(self, filters):
+        """
+        Rows for party-only metadata filters, served from the cached partitions.
+        Returns None if the filters need the general SQL path.
+        """
+        if filters is None or not filters.filters:
+            return None
+        is_or = filters.condition is not None and str(filters.condition.value).lower() == "or"
+        if not is_or and len(filters.filters) != 1:
+            return None
+        if not all(f.key == "party" and f.operator == FilterOperator.EQ for f in filters.filters):
+            return None
+        return np.unique(np.concatenate([self.party_rows(f.value) for f in filters.filters]))
+
+    def _candidate_rows(self, query):
+        """Rows allowed by the query's filters, or None if every row is a candidate."""
+        if not query.node_ids and not query.doc_ids:
+            rows = self.filter_rows(query.filters)
+            if rows is not None:
+                return rows
+
+        clauses, params = [], []
+        if query.filters is not None:
+            for metadata_filter in query.filters.filters:
+                if metadata_filter.key not in INDEXED_KEYS or metadata_filter.operator != FilterOperator.EQ:
+                    raise ValueError(f"NumpyVectorStore only supports exact-match filters on {INDEXED_KEYS}")
+                clauses.append(f"{metadata_filter.key} = ?")
+                params.append(metadata_filter.value)
+            if query.filters.condition is not None and str(query.filters.condition.value).lower() == "or":
+                clauses = [" OR ".join(clauses)] if clauses else []
+        if query.node_ids:
+            clauses.append(f"node_id IN ({','.join('?' * len(query.node_ids))})")
+            params.extend(query.node_ids)
+        if query.doc_ids:
+            clauses.append(f"ref_doc_id IN ({','.join('?' * len(query.doc_ids))})")
+            params.extend(query.doc_ids)
+        if not clauses:
+            return None
+        self.flush_rows()  # Pending rows must be in the table to be filtered
+        sql = "SELECT row FROM nodes WHERE deleted = 0 AND row < ? AND " + " AND ".join(f"({clause})" for clause in clauses)
+        params = [len(self)] + params
+        return np.fromiter((row for (row,) in self._db.connection().execute(sql, params)), dtype=np.int64)
+
+    @staticmethod
+    def _normalize_queries(query_embeddings):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        return queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    @staticmethod
+    def _select_topk(scores, rows, k):
+        k = min(k, scores.shape[1])
+        if k == 0:
+            return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=np.float32)
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        return rows[best], np.take_along_axis(best_scores, order, axis=1)
+
+    def topk(self, query_embeddings, k, rows=None):
+        """
+        Top-k rows by cosine similarity for a (n, d) batch of query embeddings,
+        optionally restricted to the given candidate rows. Returns (rows, scores), both (n, k').
+        """
+        matrix = self._matrix()
+        queries = self._normalize_queries(query_embeddings)
+        if rows is None:
+            rows = np.arange(matrix.shape[0])
+            scores = queries @ matrix.T
+        else:
+            scores = queries @ matrix[rows].T
+        if self._deleted:
+            scores[:, np.isin(rows, list(self._deleted))] = -np.inf
+        return self._select_topk(scores, rows, k)
+
+    def topk_partitioned(self, query_embeddings, k, partitions):
+        """
+        Top-k per partition from a single (queries x all rows) similarity matrix.
+        partitions maps a key to its candidate rows (None for every row);
+        returns {key: (rows, scores)} with (n, k') arrays as in topk.
+        """
+        matrix = self._matrix()
+        queries = self._normalize_queries(query_embeddings)
+        scores = queries @ matrix.T
+        if self._deleted:
+            scores[:, list(self._deleted)] = -np.inf
+        all_rows = np.arange(matrix.shape[0])
+
+        results = {}
+        for key, rows in partitions.items():
+            if rows is None:
+                results[key] = self._select_topk(scores, all_rows, k)
+            else:
+                results[key] = self._select_topk(scores[:, rows], rows, k)
+        return results
+
+    def load_nodes(self, rows):
+        """Nodes for the given rows, in the same order."""
+        rows = [int(row) for row in rows]
+        found = {}
+        pending_start = len(self) - len(self._pending_rows)
+        for row in rows:
+            if row >= pending_start:
+                found[row] = self._pending_rows[row - pending_start][5]
+        stored = [row for row in rows if row not in found]
+        if stored:
+            sql = f"SELECT row, node FROM nodes WHERE row IN ({','.join('?' * len(stored))})"
+            found.update(self._db.connection().execute(sql, stored).fetchall())
+        return [metadata_dict_to_node(json.loads(found[row])) for row in rows]
+
+    def query(self, query: VectorStoreQuery, **kwargs):
+        if len(self) == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        rows = self._candidate_rows(query)
+        top_rows, top_scores = self.topk([query.query_embedding], query.similarity_top_k, rows)
+        valid = np.isfinite(top_scores[0])
+        top_rows, top_scores = top_rows[0][valid], top_scores[0][valid]
+        nodes = self.load_nodes(top_rows)
+        return VectorStoreQueryResult(
+            nodes=nodes,
+            similarities=top_scores.tolist(),
+            ids=[node.node_id for node in nodes],
+        )
+
+    def flush_rows(self):
+        """
+        Move pending node text and metadata to the side table, so long ingestion runs
+        don't keep every chunk's text in memory. Vectors wait for persist().
+        """
+        with self._lock:
+            if not self._pending_rows:
+                return
+            conn = self._db.connection()
+            conn.executemany(
+                "INSERT INTO nodes (row, node_id, ref_doc_id, party, file_name, node) VALUES (?, ?, ?, ?, ?, ?)",
+                self._pending_rows,
+            )
+            pending_deleted = [(pending[0],) for pending in self._pending_rows if pending[0] in self._deleted]
+            conn.executemany("UPDATE nodes SET deleted = 1 WHERE row = ?", pending_deleted)
+            conn.commit()
+            self._pending_rows = []
+
+    def persist(self, persist_path=None, fs=None):
+        """Write pending rows and vectors. The store always lives in persist_dir, whatever path StorageContext passes."""
+        self.flush_rows()
+        with self._lock:
+            if not self._pending_vectors:
+                return
+            # Write the full matrix next to the old one and swap, so readers never see a partial file
+            matrix = self._matrix()
+            embeddings_path = os.path.join(self.persist_dir, EMBEDDINGS_FILE)
+            tmp_path = embeddings_path + ".tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(matrix, dtype=np.float32))
+            os.replace(tmp_path, embeddings_path)
+
+            self._embeddings = np.load(embeddings_path, mmap_mode="r")
+            self._pending_vectors = []
+            self._pending_count = 0
+            self._merged = None
+
+    def compact(self):
+        """
+        Drop deleted rows from the matrix and the side table. Renumbers rows, so no other
+        process may have the store open; updates only tombstone rows for that reason.
+        """
+        self.persist()
+        with self._lock:
+            if not self._deleted or self._embeddings is None:
+                return
+            conn = self._db.connection()
+            conn.execute("DELETE FROM nodes WHERE deleted = 1")
+            alive = [row for (row,) in conn.execute("SELECT row FROM nodes ORDER BY row")]
+            # Renumber in ascending order; each target row is always free by the time it is written
+            conn.executemany("UPDATE nodes SET row = ? WHERE row = ?", list(enumerate(alive)))
+
+            embeddings_path = os.path.join(self.persist_dir, EMBEDDINGS_FILE)
+            tmp_path = embeddings_path + ".tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(self._embeddings[alive], dtype=np.float32))
+            os.replace(tmp_path, embeddings_path)
+            conn.commit()
+
+            self._embeddings = np.load(embeddings_path, mmap_mode="r")
+            self._deleted = set()
+            self._partitions = {}
@@ -1,10 +1,14 @@
 import requests
-from llama_index.core import VectorStoreIndex, Document, ServiceContext
+import threading
+from collections import OrderedDict
+from llama_index.core import VectorStoreIndex, Document, load_index_from_storage
 from llama_index.core.storage.storage_context import StorageContext
 from pathlib import Path
 import os
 from PyPDF2 import PdfReader
 
+from config import party_index_cache_size, party_index_cache_mb
+
 party_manifestos = {
     "FDP": "https://www.fdp.de/sites/default/files/2024-03/2024-01-28_ept_das-programm-der-fdp-zur-europawahl-2024-1-_0.pdf",
     "CDU": "https://www.europawahl.cdu.de/sites/www.europawahlprogramm.cdu.de/files/docs/europawahlprogramm-cdu-csu-2024_0.pdf",
@@ -23,54 +27,94 @@ def download_pdf(url, party_name):
 
 def extract_text_from_pdf(pdf_path):
     reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+    return "".join(page.extract_text() for page in reader.pages)
 
 # Create a directory for storing indices
 PERSIST_DIR = "./stored_indices"
-party_indices = {}
-
-def load_or_create_indices():
-    for party, url in party_manifestos.items():
-        party_persist_dir = os.path.join(PERSIST_DIR, party)
-        
-        # Check if index already exists
-        if os.path.exists(os.path.join(party_persist_dir, "docstore.json")):  # Check for actual index file
-            # Load existing index
-            storage_context = StorageContext.from_defaults(persist_dir=party_persist_dir)
-            index = VectorStoreIndex.load(storage_context=storage_context)
-        else:
-            # Create new index
-            pdf_path = download_pdf(url, party)
-            text = extract_text_from_pdf(pdf_path)
-            documents = [Document(text=text)]
-            
-            # Create and save index
-            os.makedirs(party_persist_dir, exist_ok=True)
-            index = VectorStoreIndex.from_documents(documents)  # Create index first
-            
-            # Then set up storage context and persist
-            storage_context = StorageContext.from_defaults(persist_dir=party_persist_dir)
-            index.set_storage_context(storage_context)
-            index.storage_context.persist()
-            
-        party_indices[party] = index
+
+def load_or_create_index(party, url):
+    party_persist_dir = os.path.join(PERSIST_DIR, party)
+
+    # Check if index already exists
+    if os.path.exists(os.path.join(party_persist_dir, "docstore.json")):  # Check for actual index file
+        # Load existing index
+        storage_context = StorageContext.from_defaults(persist_dir=party_persist_dir)
+        return load_index_from_storage(storage_context)
+
+    # Create new index
+    pdf_path = download_pdf(url, party)
+    text = extract_text_from_pdf(pdf_path)
+    documents = [Document(text=text)]
+
+    # Create and save index
+    os.makedirs(party_persist_dir, exist_ok=True)
+    index = VectorStoreIndex.from_documents(documents)
+    index.storage_context.persist(persist_dir=party_persist_dir)
+    return index
+
+def index_size_mb(party):
+    """On-disk size of a party's persisted index, used as an estimate of its memory footprint."""
+    party_persist_dir = Path(PERSIST_DIR) / party
+    if not party_persist_dir.exists():
+        return 0.0
+    return sum(path.stat().st_size for path in party_persist_dir.rglob("*") if path.is_file()) / (1024 * 1024)
+
+
+class PartyIndexRegistry:
+    """
+    Per-party indices and query engines, loaded on first use. The least recently queried
+    parties are dropped once more than max_parties are loaded or their indices exceed max_mb.
+    """
+
+    def __init__(self, manifestos, max_parties=party_index_cache_size, max_mb=party_index_cache_mb):
+        self.manifestos = manifestos
+        self.max_parties = max_parties
+        self.max_mb = max_mb
+        self._entries = OrderedDict()  # party -> (index, query_engine, size_mb)
+        self._lock = threading.Lock()
+
+    def __contains__(self, party):
+        return party in self.manifestos
+
+    def loaded_parties(self):
+        return list(self._entries)
+
+    def _evict(self):
+        total_mb = sum(size_mb for _, _, size_mb in self._entries.values())
+        # The entry just added is kept even if it alone exceeds the cap
+        while len(self._entries) > 1 and (len(self._entries) > self.max_parties or total_mb > self.max_mb):
+            party, (_, _, size_mb) = self._entries.popitem(last=False)
+            total_mb -= size_mb
+            print(f"Unloaded index for {party}")
+
+    def query_engine(self, party):
+        with self._lock:
+            if party in self._entries:
+                self._entries.move_to_end(party)
+                return self._entries[party][1]
+            index = load_or_create_index(party, self.manifestos[party])
+            self._entries[party] = (index, index.as_query_engine(), index_size_mb(party))
+            self._evict()
+            return self._entries[party][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+party_indices = PartyIndexRegistry(party_manifestos)
 
 def query_party_manifesto(party_name, query):
     if party_name in party_indices:
-        query_engine = party_indices[party_name].as_query_engine()
+        query_engine = party_indices.query_engine(party_name)
         response = query_engine.query(query)
         return response
     else:
         return f"Party {party_name} not found"
 
-# Load or create indices when script starts
-load_or_create_indices()
-
-# Example usage
-query = "What is the party's position on climate change?"
-party = "FDP"
-response = query_party_manifesto(party, query)
-#print(f"{party}'s response:", response)
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    query = "What is the party's position on climate change?"
+    party = "FDP"
+    response = query_party_manifesto(party, query)
+    print(f"{party}'s response:", response)
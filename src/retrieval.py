@@ -0,0 +1,203 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from llama_index.core import Settings, get_response_synthesizer
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.utilities.token_counting import TokenCounter
+from llama_index.core.vector_stores.types import ExactMatchFilter, FilterCondition, MetadataFilters
+
+from config import embed_concurrency
+from metrics import current_cell_record, record_tokens
+from numpy_vector_store import NumpyVectorStore
+
+
+def normalize_party_name(name):
+    return " ".join(re.sub(r"[^\wäöüß]+", " ", name.lower()).split())
+
+
+def matching_party_values(index_parties, party_name, full_party_name):
+    """
+    Party metadata values in the index that refer to this party. The values come from the
+    LLM classification in create_index.py, so spellings vary ("Bündnis 90/Die Grünen",
+    "GRÜNE", ...); a value matches when one name contains the other as whole words.
+    """
+    names = [normalize_party_name(name) for name in (party_name, full_party_name) if name]
+    matches = []
+    for value in index_parties:
+        normalized = normalize_party_name(value)
+        if not normalized:
+            continue
+        for name in names:
+            if f" {name} " in f" {normalized} " or f" {normalized} " in f" {name} ":
+                matches.append(value)
+                break
+    return matches
+
+
+_party_filters = {}
+
+def party_filters(index, party_name, full_party_name):
+    """
+    Metadata filters restricting retrieval to one party's documents, or None to search
+    the whole corpus (no party metadata in the index, or no value matched the party).
+    """
+    key = (id(index), party_name)
+    if key not in _party_filters:
+        vector_store = index.vector_store
+        filters = None
+        if isinstance(vector_store, NumpyVectorStore):
+            values = matching_party_values(vector_store.parties(), party_name, full_party_name)
+            if values:
+                filters = MetadataFilters(
+                    filters=[ExactMatchFilter(key="party", value=value) for value in values],
+                    condition=FilterCondition.OR,
+                )
+            else:
+                print(f"No documents tagged with party {party_name}, searching all documents")
+        _party_filters[key] = filters
+    return _party_filters[key]
+
+
+_retrievers = {}
+
+def get_retriever(index, filters, top_k=6):
+    """
+    One retriever per (index, filters, top_k), built on first use and shared by every cell
+    with that retrieval configuration. Party filters are cached above, so each party's
+    filters object, and with it its retriever, is the same for the whole run.
+    """
+    key = (id(index), id(filters), top_k)
+    if key not in _retrievers:
+        # Holding on to filters keeps its id from being reused by another object
+        _retrievers[key] = (index.as_retriever(similarity_top_k=top_k, filters=filters), filters)
+    return _retrievers[key][0]
+
+
+_synthesizers = {}
+
+def get_synthesizer(response_mode):
+    if response_mode not in _synthesizers:
+        _synthesizers[response_mode] = get_response_synthesizer(response_mode=response_mode)
+    return _synthesizers[response_mode]
+
+
+class SynthesisTokenHandler(BaseCallbackHandler):
+    """
+    llama_index callback adding the tokens of the LLM calls made during synthesis to the
+    current cell's record (see metrics.cell_record). LLM events fire in the thread that
+    synthesizes, so the record is the one of the cell being built there.
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._token_counter = TokenCounter()
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        if event_type != CBEventType.LLM or payload is None or current_cell_record() is None:
+            return
+        counts = get_llm_token_counts(token_counter=self._token_counter, payload=payload, event_id=event_id)
+        record_tokens("synthesis", counts.prompt_token_count, counts.completion_token_count)
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
+
+
+_synthesis_handler = None
+
+def track_synthesis_tokens():
+    """Attach the synthesis token handler to llama_index's callback manager, once per process."""
+    global _synthesis_handler
+    if _synthesis_handler is None:
+        _synthesis_handler = SynthesisTokenHandler()
+        Settings.callback_manager.add_handler(_synthesis_handler)
+
+
+def warm_up_retrieval(index, dataset, top_k=6, scoped=True, rag_mode="tree_summarize", query=True):
+    """
+    Build the retriever of every party (and the synthesizer) before the timed loop. With
+    query set, each distinct retriever also runs the first question once, so the embedding
+    client and the store are warm; returns the mean retrieval latency in seconds, or None.
+    """
+    retrievers = {}
+    for i in range(dataset.num_parties):
+        filters = party_filters(index, dataset.party_names[i], dataset.full_party_names[i]) if scoped else None
+        retriever = get_retriever(index, filters, top_k)
+        retrievers[id(retriever)] = retriever
+    if rag_mode == "tree_summarize":
+        get_synthesizer(rag_mode)
+    if not query or not dataset.questions:
+        return None
+
+    start = time.perf_counter()
+    for retriever in retrievers.values():
+        retriever.retrieve(dataset.questions[0])
+    return (time.perf_counter() - start) / len(retrievers)
+
+
+def retrieve_batch(index, queries, top_k=6, scoped=True):
+    """
+    Sources of a batch of (party_name, full_party_name, question) queries in one search:
+    the distinct questions are embedded (as queries, exactly like a retriever does, up to
+    embed_concurrency at a time) and scored against the corpus with a single
+    questions x chunks matrix product, then ranked within each party's partition.
+    Returns one [NodeWithScore] list per query, or None if the index isn't backed by a
+    NumpyVectorStore.
+    """
+    vector_store = index.vector_store
+    if not isinstance(vector_store, NumpyVectorStore) or len(vector_store) == 0:
+        return None
+
+    questions = list(dict.fromkeys(question for _, _, question in queries))
+    question_rows = {question: n for n, question in enumerate(questions)}
+    # Query embeddings, not text embeddings: models with a query instruction embed the two differently
+    with ThreadPoolExecutor(max_workers=embed_concurrency) as pool:
+        embeddings = list(pool.map(Settings.embed_model.get_query_embedding, questions))
+
+    partitions = {}
+    for party_name, full_party_name, _ in queries:
+        key = party_name if scoped else None
+        if key not in partitions:
+            filters = party_filters(index, party_name, full_party_name) if scoped else None
+            partitions[key] = vector_store.filter_rows(filters)
+    ranked = vector_store.topk_partitioned(embeddings, top_k, partitions)
+
+    # Each chunk is read from the side table once, however many queries it serves
+    unique_rows = np.unique(np.concatenate([rows.ravel() for rows, _ in ranked.values()]))
+    nodes = dict(zip(unique_rows.tolist(), vector_store.load_nodes(unique_rows)))
+
+    sources = []
+    for party_name, _, question in queries:
+        rows, scores = ranked[party_name if scoped else None]
+        n = question_rows[question]
+        sources.append([
+            NodeWithScore(node=nodes[int(row)], score=float(score))
+            for row, score in zip(rows[n], scores[n])
+            if np.isfinite(score)
+        ])
+    return sources
+
+
+def prefetch_sources(index, dataset, top_k=6, scoped=True):
+    """
+    Retrieve the top_k source nodes of every (party, question) cell before any chat call,
+    all in one retrieve_batch. Returns {(party_idx, question_idx): [NodeWithScore]}, or
+    None if the index isn't backed by a NumpyVectorStore.
+    """
+    cells = [(i, j) for i in range(dataset.num_parties) for j in range(dataset.num_questions)]
+    queries = [(dataset.party_names[i], dataset.full_party_names[i], dataset.questions[j]) for i, j in cells]
+    sources = retrieve_batch(index, queries, top_k, scoped)
+    if sources is None:
+        return None
+    return dict(zip(cells, sources))
@@ -0,0 +1,184 @@
+"""
+All runs of execute_calc2 in one SQLite file: answer and confidence matrices as int8 blobs,
+reasons, and the run's model, settings and data file. Metadata sits in indexed columns, so
+a run is one primary-key lookup and a filtered scan never touches the blobs it skips:
+
+    python src/run_store.py list --model gpt-4o
+    python src/run_store.py import results_rag_*.csv --model gpt-4o --rag --data Party_Answers_Converted_de.json
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import run_store_path
+from storage import ProcessLocalConnection, file_sha256
+
+# int8 marker of a cell without a valid answer / confidence
+MISSING = -128
+
+# Metadata columns that list_runs and load_matrices can filter on
+FILTER_COLUMNS = ("model", "is_rag", "rag_mode", "data_file", "data_hash")
+
+
+def encode_matrix(matrix):
+    matrix = np.asarray(matrix, dtype=float)
+    encoded = np.full(matrix.shape, MISSING, dtype=np.int8)
+    valid = ~np.isnan(matrix)
+    encoded[valid] = matrix[valid]
+    return encoded.tobytes()
+
+
+def decode_matrix(blob, rows, cols):
+    encoded = np.frombuffer(blob, dtype=np.int8).reshape(rows, cols)
+    matrix = encoded.astype(float)
+    matrix[encoded == MISSING] = np.nan
+    return matrix
+
+
+class RunStore:
+    def __init__(self, path=run_store_path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = ProcessLocalConnection(path, [
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+            "model TEXT, is_rag INTEGER, rag_mode TEXT, data_file TEXT, data_hash TEXT, "
+            "num_questions INTEGER NOT NULL, num_parties INTEGER NOT NULL, failed_cells INTEGER, "
+            "metadata TEXT NOT NULL, answers BLOB NOT NULL, confidences BLOB, reasons TEXT)",
+            "CREATE INDEX IF NOT EXISTS runs_model ON runs (model, is_rag, rag_mode)",
+            "CREATE INDEX IF NOT EXISTS runs_data ON runs (data_hash)",
+        ])
+
+    def save_run(self, answers, confidences=None, reasons=None, **metadata):
+        """
+        Store one run and return its run id. answers is questions x parties with NaN for
+        missing cells, confidences likewise (0-100), reasons a nested list of strings.
+        Keys of metadata named in FILTER_COLUMNS also go into their indexed columns.
+        """
+        answers = np.asarray(answers, dtype=float)
+        rows, cols = answers.shape
+        columns = {name: metadata.get(name) for name in FILTER_COLUMNS}
+        if columns["is_rag"] is not None:
+            columns["is_rag"] = int(bool(columns["is_rag"]))
+        with self._lock:
+            conn = self._db.connection()
+            cursor = conn.execute(
+                "INSERT INTO runs (created_at, model, is_rag, rag_mode, data_file, data_hash, num_questions, "
+                "num_parties, failed_cells, metadata, answers, confidences, reasons) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(), columns["model"], columns["is_rag"], columns["rag_mode"], columns["data_file"],
+                    columns["data_hash"], rows, cols, int(np.isnan(answers).sum()),
+                    json.dumps(metadata, ensure_ascii=False, default=str),
+                    encode_matrix(answers),
+                    encode_matrix(confidences) if confidences is not None else None,
+                    json.dumps(reasons, ensure_ascii=False) if reasons is not None else None,
+                ),
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def _where(self, run_ids=None, **filters):
+        clauses, params = [], []
+        if run_ids is not None:
+            run_ids = list(run_ids)
+            clauses.append(f"run_id IN ({','.join('?' * len(run_ids))})")
+            params += run_ids
+        for name, value in filters.items():
+            if name not in FILTER_COLUMNS:
+                raise ValueError(f"Unknown run filter {name!r}, expected one of {FILTER_COLUMNS}")
+            if value is None:
+                continue
+            clauses.append(f"{name} = ?")
+            params.append(int(bool(value)) if name == "is_rag" else value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def get_run(self, run_id):
+        """Everything stored for run_id, or None."""
+        with self._lock:
+            row = self._db.connection().execute(
+                "SELECT run_id, created_at, num_questions, num_parties, metadata, answers, confidences, reasons "
+                "FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        run_id, created_at, rows, cols, metadata, answers, confidences, reasons = row
+        return {
+            "run_id": run_id,
+            "created_at": created_at,
+            "metadata": json.loads(metadata),
+            "answers": decode_matrix(answers, rows, cols),
+            "confidences": decode_matrix(confidences, rows, cols) if confidences is not None else None,
+            "reasons": json.loads(reasons) if reasons is not None else None,
+        }
+
+    def list_runs(self, **filters):
+        """Metadata of the matching runs, oldest first; the matrices are not read."""
+        where, params = self._where(**filters)
+        with self._lock:
+            rows = self._db.connection().execute(
+                "SELECT run_id, created_at, model, is_rag, rag_mode, data_file, num_questions, num_parties, failed_cells "
+                f"FROM runs{where} ORDER BY run_id",
+                params,
+            ).fetchall()
+        keys = ("run_id", "created_at", "model", "is_rag", "rag_mode", "data_file", "num_questions", "num_parties", "failed_cells")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def load_matrices(self, run_ids=None, **filters):
+        """(run ids, answer matrices) of the matching runs, read in one query."""
+        where, params = self._where(run_ids, **filters)
+        with self._lock:
+            rows = self._db.connection().execute(
+                f"SELECT run_id, num_questions, num_parties, answers FROM runs{where} ORDER BY run_id", params
+            ).fetchall()
+        return [row[0] for row in rows], [decode_matrix(blob, q, p) for _, q, p, blob in rows]
+
+    def import_csv(self, path, **metadata):
+        """Store an old results_*.csv as a run (answers only)."""
+        matrix = np.loadtxt(path, delimiter=",", ndmin=2)
+        return self.save_run(matrix, source_file=path, **metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List stored runs or import old result CSV files")
+    parser.add_argument("--store", default=run_store_path)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list")
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--data", help="Party file the runs answered, so analytics finds them")
+    for sub in (list_parser, import_parser):
+        sub.add_argument("--model")
+        sub.add_argument("--rag", dest="is_rag", action="store_true", default=None)
+        sub.add_argument("--no-rag", dest="is_rag", action="store_false")
+        sub.add_argument("--rag-mode")
+    args = parser.parse_args()
+
+    store = RunStore(args.store)
+    filters = {"model": args.model, "is_rag": args.is_rag, "rag_mode": args.rag_mode}
+    if args.command == "import":
+        source = {}
+        if args.data:
+            source = {"data_file": os.path.basename(args.data), "data_hash": file_sha256(args.data)}
+        else:
+            print("No --data given: analytics only lists these runs with --csv")
+        for path in args.files:
+            run_id = store.import_csv(path, **filters, **source)
+            print(f"Imported {path} as run {run_id}")
+        return
+
+    for run in store.list_runs(**filters):
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["created_at"]))
+        print(
+            f"{run['run_id']:>6}  {created}  {run['model'] or '-':<12} rag={run['is_rag']} {run['rag_mode'] or '-':<15} "
+            f"{run['num_questions']}x{run['num_parties']}  {run['failed_cells']} missing  {run['data_file'] or ''}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Local HTTP service for party stances and voter matching. The index is loaded and warmed
+once at startup and stays resident, so a request only pays for retrieval and the chat call:
+
+    python src/stance_server.py --data Party_Answers_Converted_de.json --port 8080
+    curl 'http://127.0.0.1:8080/stance?party=SPD&question_index=0'
+    curl 'http://127.0.0.1:8080/stance' -d '{"party": "SPD", "question": "..."}'
+    curl 'http://127.0.0.1:8080/match' -d '{"answers": ["agree", "neutral", null, ...], "top": 3}'
+
+Identical stance requests in flight at the same time share one answer, and the retrievals
+of requests arriving within retrieval_batch_window_ms are searched together with one
+retrieve_batch call. Start mock_openai_server.py and set OPENAI_BASE_URL / OPENAI_API_BASE
+to try it without the API.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import openai
+from aiohttp import web
+
+from config import (
+    api_key, openai_base_url, is_rag_context, party_scoped_retrieval, rag_mode, max_repair_attempts,
+    requests_per_minute, tokens_per_minute, server_host, server_port, retrieval_batch_window_ms, retrieval_batch_max,
+)
+from async_engine import RateLimiter, create_with_retries
+from data_processing import load_dataset, convert_answer_to_number, ANSWERS, MESSAGE_TEMPLATE, BEHAVIOUR_TEMPLATE
+from gpt_interface import get_index, rag_context_messages, chat_request, log_completion, parse_cell_response, repair_request
+from llm_cache import async_cached_chat_completion
+from matching import PartyMatcher, SKIP
+from retrieval import normalize_party_name, party_filters, get_retriever, warm_up_retrieval, retrieve_batch
+
+# Source chunks per stance, as in the batch pipeline
+TOP_K = 6
+
+
+class RetrievalBatcher:
+    """
+    Collects retrieval queries for up to window seconds, or until max_size are waiting,
+    and answers them all with one vectorized search in a worker thread.
+    """
+
+    def __init__(self, index, window=retrieval_batch_window_ms / 1000, max_size=retrieval_batch_max, scoped=True):
+        self.index = index
+        self.window = window
+        self.max_size = max_size
+        self.scoped = scoped
+        self.batches = 0
+        self.queries = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def retrieve(self, party_name, full_party_name, question):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((party_name, full_party_name, question), future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Held until done, the loop only keeps weak references to tasks
+            task = asyncio.ensure_future(self._search(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _search(self, batch):
+        self.batches += 1
+        self.queries += len(batch)
+        try:
+            sources = await asyncio.to_thread(self._retrieve, [query for query, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), nodes in zip(batch, sources):
+            # Skip waiters whose client has gone away
+            if not future.done():
+                future.set_result(nodes)
+
+    def _retrieve(self, queries):
+        sources = retrieve_batch(self.index, queries, TOP_K, self.scoped)
+        if sources is None:
+            # Index built before the memory-mapped store: one retriever call per query
+            sources = []
+            for party_name, full_party_name, question in queries:
+                filters = party_filters(self.index, party_name, full_party_name) if self.scoped else None
+                sources.append(get_retriever(self.index, filters, TOP_K).retrieve(question))
+        return sources
+
+
+def parse_voter_answers(answers, num_questions):
+    """A voter's answers ("agree"/"neutral"/"disagree" or 1/0/-1, None or "skip" to skip) as matcher values."""
+    if not isinstance(answers, list) or len(answers) != num_questions:
+        raise ValueError(f"Expected a list of {num_questions} answers")
+    values = []
+    for answer in answers:
+        if answer is None or answer == "skip":
+            values.append(SKIP)
+        elif isinstance(answer, str) and answer.lower() in ANSWERS:
+            values.append(convert_answer_to_number(answer))
+        elif isinstance(answer, int) and answer in (-1, 0, 1):
+            values.append(int(answer))
+        else:
+            raise ValueError(f"Invalid answer {answer!r}, expected one of {ANSWERS}, -1, 0, 1 or null")
+    return values
+
+
+class StanceService:
+    """Answers stance and matching requests against one party file and a resident index."""
+
+    def __init__(self, filepath, index=None, rag=is_rag_context, rag_mode=rag_mode):
+        # Every party and question of the file; the batch-run cutoffs don't apply to the service
+        self.dataset = load_dataset(filepath, cutoffs=False)
+        self.matcher = PartyMatcher.from_party_file(filepath)
+        self.rag = rag
+        self.rag_mode = rag_mode
+        self.batcher = RetrievalBatcher(index, scoped=party_scoped_retrieval) if rag else None
+        # Retries are handled by create_with_retries, so 429s pause every in-flight request
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=openai_base_url, max_retries=0)
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.stats = {"stance_requests": 0, "coalesced": 0, "failed": 0, "match_requests": 0, "voters_matched": 0}
+        self._question_rows = {question: j for j, question in enumerate(self.dataset.questions)}
+        self._in_flight = {}
+
+    async def close(self):
+        await self.client.close()
+
+    def party_index(self, party):
+        """Index of a party given by short name, full name (any case) or position in the party file."""
+        if party is None:
+            raise ValueError("Missing party")
+        if isinstance(party, int) or str(party).isdigit():
+            i = int(party)
+            if not 0 <= i < self.dataset.num_parties:
+                raise ValueError(f"Party index {i} out of range")
+            return i
+        wanted = normalize_party_name(str(party))
+        for i, names in enumerate(zip(self.dataset.party_names, self.dataset.full_party_names)):
+            if wanted in (normalize_party_name(name) for name in names):
+                return i
+        raise ValueError(f"Unknown party {party!r}, expected one of {self.dataset.party_names}")
+
+    def question_text(self, question=None, question_index=None):
+        if question_index is not None:
+            j = int(question_index)
+            if not 0 <= j < self.dataset.num_questions:
+                raise ValueError(f"Question index {j} out of range")
+            return self.dataset.questions[j]
+        if not question or not str(question).strip():
+            raise ValueError("Missing question or question_index")
+        return str(question).strip()
+
+    async def _create(self, **request):
+        return await create_with_retries(self.client, self.limiter, request)
+
+    async def stance(self, i, question):
+        """(validated answer or {}, source nodes) of party i on question."""
+        self.stats["stance_requests"] += 1
+        key = (i, question)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._answer(i, question))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded, so a client hanging up doesn't cancel the answer others are waiting for
+        return await asyncio.shield(task)
+
+    async def _answer(self, i, question):
+        # Same prompts as the batch pipeline, so a question from the party file shares its cached responses
+        j = self._question_rows.get(question)
+        full_party_name = self.dataset.full_party_names[i]
+        message = MESSAGE_TEMPLATE.format(question=question)
+        behaviour = BEHAVIOUR_TEMPLATE.format(country=self.dataset.country, question=question, full_party_name=full_party_name)
+
+        sources = []
+        if self.rag:
+            sources = await self.batcher.retrieve(self.dataset.party_names[i], full_party_name, question)
+            # Synthesis makes blocking LLM calls
+            messages = await asyncio.to_thread(rag_context_messages, behaviour, message, question, sources, self.rag_mode, [i, j])
+        else:
+            messages = [
+                {"role": "system", "content": behaviour},
+                {"role": "user", "content": message},
+            ]
+
+        request = chat_request(messages, self.rag)
+        for attempt in range(max_repair_attempts + 1):
+            start = time.perf_counter()
+            response = await async_cached_chat_completion(self._create, **request)
+            log_completion(i, j, request, response, time.perf_counter() - start)
+            parsed = parse_cell_response(request, response)
+            if parsed or attempt == max_repair_attempts:
+                break
+            request = repair_request(request, response)
+        if not parsed:
+            self.stats["failed"] += 1
+        return parsed, sources
+
+    def match(self, voters, weights=None, top=None):
+        """Ranked [{"party", "score"}] per voter."""
+        self.stats["match_requests"] += 1
+        self.stats["voters_matched"] += len(voters)
+        order, scores = self.matcher.rank(np.asarray(voters, dtype=np.int8), weights, top)
+        return [
+            [
+                {"party": self.matcher.party_names[idx], "score": None if np.isnan(score) else float(score)}
+                for idx, score in zip(order_row, score_row)
+            ]
+            for order_row, score_row in zip(order, scores)
+        ]
+
+    def summary(self):
+        stats = dict(self.stats, in_flight=len(self._in_flight))
+        if self.batcher is not None:
+            stats["retrieval_batches"] = self.batcher.batches
+            stats["retrieval_queries"] = self.batcher.queries
+            stats["mean_batch_size"] = self.batcher.queries / self.batcher.batches if self.batcher.batches else 0.0
+        return stats
+
+
+async def request_params(request):
+    """Query string parameters, overridden by the JSON body of a POST."""
+    params = dict(request.query)
+    if request.can_read_body:
+        body = await request.json()
+        if not isinstance(body, dict):
+            raise ValueError("Expected a JSON object")
+        params.update(body)
+    return params
+
+
+def error_response(message, status=400):
+    return web.json_response({"error": message}, status=status)
+
+
+async def handle_stance(request):
+    service = request.app["service"]
+    try:
+        params = await request_params(request)
+        i = service.party_index(params.get("party"))
+        question = service.question_text(params.get("question"), params.get("question_index"))
+    except ValueError as e:
+        return error_response(str(e))
+
+    start = time.perf_counter()
+    try:
+        parsed, sources = await service.stance(i, question)
+    except Exception as e:
+        return error_response(f"{type(e).__name__}: {e}", status=502)
+    if not parsed:
+        return error_response("The model's answer could not be parsed", status=502)
+
+    return web.json_response({
+        "party": service.dataset.party_names[i],
+        "full_party_name": service.dataset.full_party_names[i],
+        "question": question,
+        "answer": parsed["AI_answer"],
+        "value": convert_answer_to_number(parsed["AI_answer"]),
+        "reason": parsed.get("AI_answer_reason"),
+        "confidence": parsed.get("AI_confidence"),
+        "sources": [
+            {"node_id": node.node.node_id, "score": node.score, "party": node.node.metadata.get("party")}
+            for node in sources
+        ],
+        "latency_s": time.perf_counter() - start,
+    })
+
+
+async def handle_match(request):
+    service = request.app["service"]
+    try:
+        params = await request_params(request)
+        single = "voters" not in params
+        voters = [params.get("answers")] if single else params["voters"]
+        if not isinstance(voters, list) or not voters:
+            raise ValueError("Expected answers or a non-empty list of voters")
+        voters = [parse_voter_answers(answers, service.matcher.num_questions) for answers in voters]
+        weights = params.get("weights")
+        top = params.get("top")
+        # Large batches are a few matrix products; keep them off the event loop
+        rankings = await asyncio.to_thread(service.match, voters, weights, int(top) if top is not None else None)
+    except ValueError as e:
+        return error_response(str(e))
+    return web.json_response({"ranking": rankings[0]} if single else {"rankings": rankings})
+
+
+async def handle_health(request):
+    service = request.app["service"]
+    return web.json_response({
+        "status": "ok",
+        "parties": service.dataset.party_names,
+        "questions": service.dataset.num_questions,
+        "rag": service.rag,
+        "rag_mode": service.rag_mode if service.rag else None,
+    })
+
+
+async def handle_stats(request):
+    return web.json_response(request.app["service"].summary())
+
+
+def create_app(filepath, rag=is_rag_context, rag_mode=rag_mode):
+    app = web.Application()
+
+    async def load_index(app):
+        index = None
+        if rag:
+            start = time.perf_counter()
+            index = await asyncio.to_thread(get_index)
+            print(f"Index loaded in {time.perf_counter() - start:.1f}s")
+            latency = await asyncio.to_thread(
+                warm_up_retrieval, index, load_dataset(filepath, cutoffs=False), TOP_K, party_scoped_retrieval, rag_mode
+            )
+            if latency is not None:
+                print(f"Retrieval warm-up: {latency * 1000:.1f} ms per query")
+        app["service"] = StanceService(filepath, index, rag, rag_mode)
+
+    async def close_service(app):
+        await app["service"].close()
+
+    app.on_startup.append(load_index)
+    app.on_cleanup.append(close_service)
+    app.router.add_route("*", "/stance", handle_stance)
+    app.router.add_post("/match", handle_match)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve party stances and voter matching over HTTP")
+    parser.add_argument("--data", default="Party_Answers_Converted_de.json")
+    parser.add_argument("--host", default=server_host)
+    parser.add_argument("--port", type=int, default=server_port)
+    parser.add_argument("--rag", dest="rag", action="store_true", default=is_rag_context)
+    parser.add_argument("--no-rag", dest="rag", action="store_false")
+    parser.add_argument("--rag-mode", default=rag_mode, choices=["tree_summarize", "retrieval_only"])
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.data, args.rag, args.rag_mode), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Helpers shared by the on-disk stores: LLM cache, embedding cache, node table and run store."""
+import hashlib
+import os
+import sqlite3
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ProcessLocalConnection:
+    """
+    One SQLite connection per process, opened on first use with schema (a list of
+    statements) applied. Connections must not cross a fork, so a pool worker that
+    inherits this object opens its own.
+    """
+
+    def __init__(self, path, schema=(), wal=True, timeout=30):
+        self.path = path
+        self.schema = list(schema)
+        self.wal = wal
+        self.timeout = timeout
+        self._conn = None
+        self._pid = None
+
+    def connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            if self.wal:
+                conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
@@ -1,10 +1,12 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 import textwrap
 from config import is_rag_context
 import os
 def create_comparison_plot(original_matrix, ai_matrix, questions, party_names):
+    # Plotting libraries take most of a second to import; only pay for that when plotting
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # Calculate difference matrix
     diff_matrix = np.abs(original_matrix - ai_matrix)
     
@@ -13,6 +15,7 @@ def create_comparison_plot(original_matrix, ai_matrix, questions, party_names):
     color_matrix[diff_matrix == 0] = 2    # Full agreement (blue)
     color_matrix[diff_matrix == 1] = 1    # Partial agreement (light blue)
     color_matrix[diff_matrix == 2] = 0    # Disagreement (white)
+    color_matrix[np.isnan(diff_matrix)] = 3    # No valid AI answer (grey)
 
     # Determine figure size based on the number of questions and parties
     num_questions = len(questions)
@@ -21,7 +24,7 @@ def create_comparison_plot(original_matrix, ai_matrix, questions, party_names):
     fig_width = max(5, num_parties * 0.5)  # Adjust the multiplier as needed for spacing
     plt.figure(figsize=(fig_width, fig_height))
     
-    colors = ['white', 'lightblue', 'blue']
+    colors = ['white', 'lightblue', 'blue', 'lightgrey']
     cmap = sns.color_palette(colors)
     
     # Format long questions with more width to reduce line breaks
@@ -31,6 +34,8 @@ def create_comparison_plot(original_matrix, ai_matrix, questions, party_names):
                 xticklabels=party_names, 
                 yticklabels=wrapped_questions,
                 cmap=cmap,
+                vmin=0,
+                vmax=len(colors) - 1,
                 cbar=False)
 
     plt.title('Comparison between Original Party Answers\nand AI Predictions')
@@ -47,7 +52,8 @@ def create_comparison_plot(original_matrix, ai_matrix, questions, party_names):
     # Add legend
     legend_elements = [plt.Rectangle((0,0),1,1, facecolor='blue', label='Full Agreement'),
                       plt.Rectangle((0,0),1,1, facecolor='lightblue', label='Partial Agreement'),
-                      plt.Rectangle((0,0),1,1, facecolor='white', label='Disagreement')]
+                      plt.Rectangle((0,0),1,1, facecolor='white', label='Disagreement'),
+                      plt.Rectangle((0,0),1,1, facecolor='lightgrey', label='No AI Answer')]
     plt.legend(handles=legend_elements, loc='center left', bbox_to_anchor=(1, 0.5))
 
     plt.tight_layout()
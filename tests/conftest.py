@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules live as flat scripts in src/, imported by their bare names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from analytics import VALUES, agreement, cohens_kappa, confusion_matrices
+
+# Rows are the reference answer, columns the run's, in VALUES order
+CONFUSION = np.array([[10, 2, 0], [3, 8, 1], [0, 2, 4]])
+
+
+def cells(confusion):
+    """(run, reference) answer columns with exactly the given confusion counts."""
+    pairs = [(VALUES[col], VALUES[row]) for row in range(3) for col in range(3) for _ in range(confusion[row, col])]
+    run, reference = np.array(pairs, dtype=float).T
+    return run, reference
+
+
+def test_confusion_matrices_skip_unanswered_cells():
+    run, reference = cells(CONFUSION)
+    # Unanswered cells on either side are not counted
+    run = np.append(run, [np.nan, 1.0])
+    reference = np.append(reference, [1.0, np.nan])
+    stack = run.reshape(1, -1, 1)
+    np.testing.assert_array_equal(confusion_matrices(stack, reference.reshape(-1, 1)), [CONFUSION])
+    assert agreement(stack, reference.reshape(-1, 1))["per_run"][0] == pytest.approx(22 / 30)
+
+
+def test_cohens_kappa():
+    # p_o = 22/30, p_e = (12*13 + 12*12 + 6*5) / 30**2
+    assert cohens_kappa(CONFUSION[None])[0] == pytest.approx((22 / 30 - 330 / 900) / (1 - 330 / 900))
+    # Weighted disagreement: observed 4, expected 11.8 (in counts)
+    assert cohens_kappa(CONFUSION[None], weights="linear")[0] == pytest.approx(1 - 4 / 11.8)
+
+
+def test_cohens_kappa_edge_cases():
+    perfect = np.diag([5, 3, 2])
+    kappas = cohens_kappa(np.stack([perfect, np.zeros((3, 3), dtype=int)]))
+    assert kappas[0] == pytest.approx(1.0)
+    assert np.isnan(kappas[1])  # A run without answered cells has no kappa
@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import async_engine
+import llm_cache
+
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request):
+        self.requests.append(request)
+        return SimpleNamespace(usage=None)
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(llm_cache, "llm_cache_mode", "off")
+
+
+def test_limiter_is_shared_across_calls():
+    client = FakeClient()
+    results = []
+
+    def on_result(job_id, request, response, error, latency):
+        results.append((job_id, error))
+
+    def jobs(ids):
+        return [(job_id, lambda: {"model": "m", "messages": [], "max_tokens": 10}) for job_id in ids]
+
+    async def run_rounds():
+        limiter = async_engine.RateLimiter(requests_per_minute=60, tokens_per_minute=None)
+        await async_engine.run_chat_requests(jobs([1, 2, 3]), on_result, client=client, limiter=limiter)
+        await async_engine.run_chat_requests(jobs([4, 5]), on_result, client=client, limiter=limiter)
+        return limiter
+
+    limiter = asyncio.run(run_rounds())
+    assert sorted(results) == [(n, None) for n in range(1, 6)]
+    assert len(client.requests) == 5
+    # Both rounds drew from the same budget
+    assert limiter.requests.available == pytest.approx(55, abs=0.5)
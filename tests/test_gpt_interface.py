@@ -0,0 +1,28 @@
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+import gpt_interface
+import interaction_log
+import retrieval
+
+
+@pytest.fixture(autouse=True)
+def log_to_tmp(tmp_path):
+    interaction_log.start_log(str(tmp_path / "log.jsonl"))
+    yield
+    interaction_log.stop_log()
+
+
+def test_rag_mode_override_after_import_applies(monkeypatch):
+    # benchmark_pipeline.py overrides rag_mode on the imported module, after the defaults were bound
+    monkeypatch.setattr(gpt_interface, "rag_mode", "retrieval_only")
+
+    def no_synthesis(*args, **kwargs):
+        raise AssertionError("retrieval_only must not build a synthesizer")
+
+    monkeypatch.setattr(retrieval, "get_synthesizer", no_synthesis)
+    sources = [NodeWithScore(node=TextNode(text="Mindestlohn auf 15 Euro"), score=0.9)]
+    messages = gpt_interface.rag_context_messages("Behaviour. ", "Mindestlohn?", "Mindestlohn?", sources)
+    assert "Mindestlohn auf 15 Euro" in messages[0]["content"]
+    assert gpt_interface.configured_rag_mode() == "retrieval_only"
+    assert gpt_interface.configured_rag_mode("tree_summarize") == "tree_summarize"
@@ -0,0 +1,18 @@
+import json
+
+import interaction_log
+
+
+def test_bad_record_does_not_stop_the_writer(tmp_path):
+    path = tmp_path / "log.jsonl"
+    interaction_log.start_log(str(path))
+    try:
+        interaction_log.log_event("completion", cell=[0, 0])
+        interaction_log.log_event("completion", cell=[0, 1])
+        interaction_log.log_event("retrieval", cell=[0, 2], nodes={1, 2})  # Sets are not JSON
+        interaction_log.log_event("completion", cell=[0, 3])
+    finally:
+        interaction_log.stop_log()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [record["cell"] for record in records] == [[0, 0], [0, 1], [0, 3]]
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+import llm_cache
+from llm_cache import LLMCache, LLMCacheMiss, async_cached_chat_completion
+from metrics import cell_record
+
+REQUEST = {"model": "gpt-4o", "messages": [{"role": "user", "content": "question: Mindestlohn?"}], "temperature": 0}
+
+
+def completion(content):
+    return ChatCompletion.model_validate({
+        "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setattr(llm_cache, "llm_cache_mode", "readwrite")
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    return cache
+
+
+def test_repeated_request_is_served_from_cache(cache):
+    calls = []
+
+    async def create(**request):
+        calls.append(request)
+        return completion("agree")
+
+    with cell_record() as first:
+        response = asyncio.run(async_cached_chat_completion(create, **REQUEST))
+    with cell_record() as second:
+        cached = asyncio.run(async_cached_chat_completion(create, **REQUEST))
+
+    assert len(calls) == 1
+    assert cached.choices[0].message.content == response.choices[0].message.content == "agree"
+    assert first["llm_cache"] == {"hits": 0, "misses": 1}
+    assert second["llm_cache"] == {"hits": 1, "misses": 0}
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+    # A different request is a different key
+    asyncio.run(async_cached_chat_completion(create, **dict(REQUEST, temperature=1)))
+    assert len(calls) == 2
+
+
+def test_replay_mode_never_calls_the_api(cache, monkeypatch):
+    key = cache.make_key(REQUEST)
+    cache.put(key, "gpt-4o", completion("neutral").model_dump_json())
+    cache.mode = "replay"
+
+    async def create(**request):
+        raise AssertionError("replay mode must not call the API")
+
+    assert asyncio.run(async_cached_chat_completion(create, **REQUEST)).choices[0].message.content == "neutral"
+    with pytest.raises(LLMCacheMiss):
+        asyncio.run(async_cached_chat_completion(create, **dict(REQUEST, temperature=1)))
+
+
+def test_evict_expired_and_least_recently_used(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"), max_age_days=1)
+    cache.put("old", "gpt-4o", "x" * 10)
+    cache.put("new", "gpt-4o", "y" * 10)
+    conn = cache._db.connection()
+    conn.execute("UPDATE responses SET created_at = ? WHERE key = 'old'", (time.time() - 2 * 86400,))
+    conn.commit()
+    assert cache.evict() == 1
+    assert cache.get("old") is None and cache.get("new") == "y" * 10
+
+    cache.max_age_days = None
+    cache.max_mb = 15 / (1024 * 1024)  # Room for one 10 byte response
+    cache.put("newest", "gpt-4o", "z" * 10)
+    assert cache.evict() == 1
+    assert cache.get("new") is None and cache.get("newest") == "z" * 10
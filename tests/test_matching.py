@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+
+from matching import SKIP, PartyMatcher
+
+
+def reference_scores(party_matrix, voters, weights):
+    """Wahl-O-Mat points, one voter, party and question at a time."""
+    scores = np.full((len(voters), party_matrix.shape[1]), np.nan)
+    for n, voter in enumerate(voters):
+        for party in range(party_matrix.shape[1]):
+            points = maximum = 0.0
+            for question, answer in enumerate(voter):
+                position = party_matrix[question, party]
+                if answer == SKIP or np.isnan(position):
+                    continue
+                points += weights[n, question] * (2 - abs(answer - position))
+                maximum += weights[n, question] * 2
+            if maximum:
+                scores[n, party] = points / maximum
+    return scores
+
+
+def test_scores_match_per_question_points():
+    rng = np.random.default_rng(0)
+    party_matrix = rng.integers(-1, 2, size=(12, 5)).astype(float)
+    party_matrix[rng.random(party_matrix.shape) < 0.2] = np.nan
+    party_matrix[:, 4] = np.nan  # A party without any answer can't be matched
+    voters = rng.integers(-1, 2, size=(50, 12)).astype(np.int8)
+    voters[rng.random(voters.shape) < 0.2] = SKIP
+    weights = rng.choice([1.0, 2.0], size=voters.shape)
+
+    matcher = PartyMatcher(party_matrix, [f"P{n}" for n in range(5)])
+    np.testing.assert_allclose(matcher.scores(voters, weights, chunk_size=16), reference_scores(party_matrix, voters, weights),
+                               rtol=1e-6)
+    np.testing.assert_allclose(matcher.scores(voters), reference_scores(party_matrix, voters, np.ones(voters.shape)),
+                               rtol=1e-6)
+    with pytest.raises(ValueError):
+        matcher.scores(voters[:, :5])
+
+
+def test_match_from_party_file(tmp_path):
+    answers = {"SPD": [1, 1, -1], "FDP": [-1, 1, 0], "CDU": [-1, -1, 0]}
+    path = tmp_path / "parties.json"
+    path.write_text(json.dumps({
+        "party_names": list(answers),
+        "party_full_names": ["Sozialdemokratische Partei", "Freie Demokratische Partei", "Christlich Demokratische Union"],
+        "party_answers": [
+            {"Party_Name": party, "Question_Label": f"Q{q}", "Question_Number": q + 1, "Party_Answer": answer}
+            for party, values in answers.items()
+            for q, answer in enumerate(values)
+        ],
+    }), encoding="utf-8")
+
+    matcher = PartyMatcher.from_party_file(str(path))
+    assert matcher.questions == ["Q0", "Q1", "Q2"]
+    ranked = matcher.match([1, 1, -1])
+    assert [name for name, _ in ranked] == ["SPD", "FDP", "CDU"]
+    assert [score for _, score in ranked] == pytest.approx([1.0, 0.5, 1 / 6])
@@ -0,0 +1,101 @@
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters, VectorStoreQuery
+
+from numpy_vector_store import NumpyVectorStore
+
+
+def make_node(node_id, vector, party="SPD", file_name="spd.pdf"):
+    return TextNode(id_=node_id, text=node_id, metadata={"party": party, "file_name": file_name}, embedding=vector)
+
+
+def query(store, vector, k=10, party=None):
+    filters = MetadataFilters(filters=[MetadataFilter(key="party", value=party)]) if party else None
+    result = store.query(VectorStoreQuery(query_embedding=vector, similarity_top_k=k, filters=filters))
+    return result.ids
+
+
+def build(persist_dir):
+    store = NumpyVectorStore(persist_dir=str(persist_dir), overwrite=True)
+    store.add([
+        make_node("spd-1", [1.0, 0.0, 0.0]),
+        make_node("spd-2", [0.9, 0.1, 0.0]),
+        make_node("cdu-1", [0.0, 1.0, 0.0], party="CDU", file_name="cdu.pdf"),
+    ])
+    store.persist()
+    return store
+
+
+def test_round_trip(tmp_path):
+    build(tmp_path)
+    store = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert len(store) == 3
+    assert store.parties() == ["CDU", "SPD"]
+    assert query(store, [1.0, 0.0, 0.0], k=2) == ["spd-1", "spd-2"]
+    assert query(store, [1.0, 0.0, 0.0], party="CDU") == ["cdu-1"]
+
+
+def test_reader_opened_during_update_leaves_writer_rows(tmp_path):
+    build(tmp_path)
+    writer = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    writer.recover()
+    writer.add([make_node("fdp-1", [0.0, 0.0, 1.0], party="FDP", file_name="fdp.pdf")])
+    writer.flush_rows()
+
+    # Rows are in the table but their vectors are not in the .npy yet
+    reader = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert len(reader) == 3
+    assert reader.parties() == ["CDU", "SPD"]
+    assert query(reader, [0.0, 0.0, 1.0], party="FDP") == []
+    assert "fdp-1" not in query(reader, [0.0, 0.0, 1.0])
+
+    writer.persist()
+    reopened = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert query(reopened, [0.0, 0.0, 1.0], party="FDP") == ["fdp-1"]
+
+
+def test_recover_drops_rows_of_a_dead_run(tmp_path):
+    build(tmp_path)
+    crashed = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    crashed.add([make_node("fdp-1", [0.0, 0.0, 1.0], party="FDP", file_name="fdp.pdf")])
+    crashed.flush_rows()  # Dies here, before persist()
+
+    writer = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    writer.recover()
+    # The row number is free again, so re-adding the file doesn't clash
+    writer.add([make_node("fdp-1", [0.0, 0.0, 1.0], party="FDP", file_name="fdp.pdf")])
+    writer.persist()
+    assert len(writer) == 4
+    assert query(writer, [0.0, 0.0, 1.0], party="FDP") == ["fdp-1"]
+
+
+def test_compact_drops_deleted_rows(tmp_path):
+    store = build(tmp_path)
+    store.delete_file("spd.pdf")
+    assert query(store, [1.0, 0.0, 0.0]) == ["cdu-1"]
+
+    store.compact()
+    reopened = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.file_names() == {"cdu.pdf"}
+    assert query(reopened, [1.0, 0.0, 0.0]) == ["cdu-1"]
+    assert np.allclose(reopened.topk([[0.0, 1.0, 0.0]], 1)[1], 1.0)
+
+
+def test_resident_reader_survives_an_update(tmp_path):
+    build(tmp_path)
+    reader = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert query(reader, [1.0, 0.0, 0.0], party="SPD") == ["spd-1", "spd-2"]
+
+    # What create_index.py does on [u]pdate when spd.pdf changed
+    writer = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    writer.recover()
+    writer.delete_file("spd.pdf")
+    writer.add([make_node("spd-3", [1.0, 0.0, 0.0])])
+    writer.persist()
+
+    # The resident reader still sees its own generation, with every row where it was
+    assert query(reader, [1.0, 0.0, 0.0], party="SPD") == ["spd-1", "spd-2"]
+    assert query(reader, [0.0, 1.0, 0.0], k=1) == ["cdu-1"]
+    reopened = NumpyVectorStore.from_persist_dir(str(tmp_path))
+    assert query(reopened, [1.0, 0.0, 0.0], party="SPD") == ["spd-3"]
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import TextNode
+
+import retrieval
+from numpy_vector_store import NumpyVectorStore
+
+
+class AsymmetricEmbedding(BaseEmbedding):
+    """Letter counts; queries get an extra instruction component, like instruction-tuned models."""
+
+    def _get_text_embedding(self, text):
+        return [float(text.lower().count(letter)) + 0.01 for letter in "abcdefghijklmnopqrstuvwxyz"]
+
+    def _get_query_embedding(self, query):
+        vector = self._get_text_embedding(query)
+        vector[0] += 10.0
+        return vector
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+
+TEXTS = {
+    "SPD": ["Mindestlohn erhoehen", "Tarifbindung staerken", "Aaaa aaaa Rente sichern", "Bahn ausbauen"],
+    "CDU": ["Steuern senken", "Aaaa Grenzen schuetzen", "Buerokratie abbauen", "Wehrpflicht pruefen"],
+}
+QUESTIONS = ["Soll der Mindestlohn steigen?", "Sollen Steuern sinken?", "Braucht es mehr Bahn?"]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    embed_model = AsymmetricEmbedding()
+    monkeypatch.setattr(Settings, "_embed_model", embed_model)
+    retrieval._party_filters.clear()
+    retrieval._retrievers.clear()
+    store = NumpyVectorStore(persist_dir=str(tmp_path), overwrite=True)
+    store.add([
+        TextNode(id_=f"{party}-{n}", text=text, metadata={"party": party}, embedding=embed_model.get_text_embedding(text))
+        for party, texts in TEXTS.items()
+        for n, text in enumerate(texts)
+    ])
+    store.persist()
+    return VectorStoreIndex.from_vector_store(store)
+
+
+def test_prefetched_sources_match_per_cell_retrieval(index):
+    dataset = SimpleNamespace(
+        num_parties=2, num_questions=len(QUESTIONS), party_names=["SPD", "CDU"],
+        full_party_names=["Sozialdemokratische Partei", "Christlich Demokratische Union"], questions=QUESTIONS,
+    )
+    prefetched = retrieval.prefetch_sources(index, dataset, top_k=2)
+
+    for (i, j), sources in prefetched.items():
+        filters = retrieval.party_filters(index, dataset.party_names[i], dataset.full_party_names[i])
+        expected = retrieval.get_retriever(index, filters, top_k=2).retrieve(QUESTIONS[j])
+        assert [node.node.node_id for node in sources] == [node.node.node_id for node in expected]
+        assert np.allclose([node.score for node in sources], [node.score for node in expected], atol=1e-5)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from run_store import RunStore
+
+
+def test_run_round_trip(tmp_path):
+    store = RunStore(str(tmp_path / "runs.sqlite"))
+    answers = np.array([[1, -1, np.nan], [0, 1, -1]])
+    confidences = np.array([[90, 55, np.nan], [0, 100, 70]])
+    reasons = [["ja", "nein", None], ["neutral", "ja", "nein"]]
+    run_id = store.save_run(answers, confidences, reasons, model="gpt-4o", is_rag=True, rag_mode="retrieval_only",
+                            data_file="parties.json", seed=7)
+
+    run = store.get_run(run_id)
+    np.testing.assert_array_equal(run["answers"], answers)
+    np.testing.assert_array_equal(run["confidences"], confidences)
+    assert run["reasons"] == reasons
+    assert run["metadata"]["seed"] == 7
+    assert store.get_run(run_id + 1) is None
+
+    [listed] = store.list_runs()
+    assert listed["model"] == "gpt-4o" and listed["is_rag"] == 1 and listed["failed_cells"] == 1
+    assert (listed["num_questions"], listed["num_parties"]) == (2, 3)
+
+
+def test_filters_and_matrices(tmp_path):
+    store = RunStore(str(tmp_path / "runs.sqlite"))
+    rag = store.save_run(np.ones((2, 2)), model="gpt-4o", is_rag=True, rag_mode="tree_summarize")
+    plain = store.save_run(-np.ones((2, 2)), model="gpt-4o", is_rag=False)
+    store.save_run(np.zeros((2, 2)), model="gpt-4o-mini", is_rag=False)
+
+    assert [run["run_id"] for run in store.list_runs(model="gpt-4o")] == [rag, plain]
+    assert [run["run_id"] for run in store.list_runs(is_rag=False, model="gpt-4o")] == [plain]
+    run_ids, matrices = store.load_matrices(model="gpt-4o", is_rag=False)
+    assert run_ids == [plain]
+    np.testing.assert_array_equal(matrices[0], -np.ones((2, 2)))
+
+
+def test_import_csv(tmp_path):
+    path = tmp_path / "results_rag_1.csv"
+    np.savetxt(path, np.array([[1, 0], [-1, 1]]), delimiter=",")
+    store = RunStore(str(tmp_path / "runs.sqlite"))
+    run_id = store.import_csv(str(path), model="gpt-4o", is_rag=True)
+    run = store.get_run(run_id)
+    np.testing.assert_array_equal(run["answers"], [[1, 0], [-1, 1]])
+    assert run["confidences"] is None and run["metadata"]["source_file"] == str(path)